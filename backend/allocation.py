@@ -0,0 +1,205 @@
+"""Slot allocation strategies backed by per-zone heaps.
+
+``book_spot`` asks the allocator which free slot to claim. Strategies:
+
+- ``lowest``: the free slot with the lowest number. Lots are numbered from
+  the entrance, so this keeps cars closest to the exit.
+- ``lru``: the slot released longest ago, spreading wear across sensors.
+- ``floor_round_robin``: the lowest free slot on each floor in turn. The
+  schema has no floor column, so a floor is a run of ``SLOTS_PER_FLOOR``
+  consecutive slot numbers.
+- ``city_spread``: the lowest free slot in whichever lot of the requested
+  lot's city has the largest share of free slots.
+
+Each zone keeps one heap per ordering, built lazily from the occupancy
+index on first use. Taking a slot does not touch the heaps: a pick pops
+entries whose slot is no longer free (lazy deletion), and the occupancy
+index's slot listener pushes slots back as they are released, so a pick
+costs O(log n) amortized instead of a table query.
+"""
+import heapq
+import threading
+from datetime import datetime
+from sqlalchemy import select, func
+from models import db, Booking, ParkingSlot, ParkingZone
+from occupancy import occupancy
+
+STRATEGIES = ('lowest', 'lru', 'floor_round_robin', 'city_spread')
+DEFAULT_STRATEGY = 'lowest'
+DEFAULT_SLOTS_PER_FLOOR = 50
+
+
+def slot_number_key(slot_number, fallback):
+    # Provisioned slots are named "<lot name>-<n>"; anything else keeps its id order
+    suffix = slot_number.rsplit('-', 1)[-1]
+    return int(suffix) if suffix.isdigit() else fallback
+
+
+def _pick(heap, zone, usable, is_current=None):
+    """Smallest entry whose slot is free and ``usable``; stale entries are dropped on the way."""
+    held = []
+    found = None
+    while heap:
+        entry = heap[0]
+        slot_id = entry[-1]
+        if not zone.is_free(slot_id) or (is_current and not is_current(entry)):
+            heapq.heappop(heap)
+            continue
+        if usable(slot_id):
+            found = slot_id
+            break
+        # Free but unusable for this request (tried already, reserved); keep it for the next one
+        held.append(heapq.heappop(heap))
+    for entry in held:
+        heapq.heappush(heap, entry)
+    return found
+
+
+class ZoneSlots:
+    __slots__ = ('source', 'numbers', 'last_used', 'floors', 'floor_order', 'next_floor',
+                 'lowest', 'lru', 'floor_heaps')
+
+    def __init__(self, source, numbers, last_used, slots_per_floor):
+        # The ZoneOccupancy these heaps mirror; a rebuilt or re-added zone gets a new one
+        self.source = source
+        self.numbers = numbers
+        self.last_used = last_used
+        self.floors = {slot_id: (number - 1) // slots_per_floor for slot_id, number in numbers.items()}
+        self.floor_order = sorted(set(self.floors.values()))
+        self.next_floor = 0
+        self.rebuild_heaps()
+
+    def rebuild_heaps(self):
+        free = list(self.source.free_slot_ids())
+        self.lowest = [(self.numbers[slot_id], slot_id) for slot_id in free]
+        self.lru = [(self.last_used[slot_id], self.numbers[slot_id], slot_id) for slot_id in free]
+        self.floor_heaps = {floor: [] for floor in self.floor_order}
+        for slot_id in free:
+            self.floor_heaps[self.floors[slot_id]].append((self.numbers[slot_id], slot_id))
+        for heap in (self.lowest, self.lru, *self.floor_heaps.values()):
+            heapq.heapify(heap)
+
+    def push(self, slot_id, released_at):
+        if slot_id not in self.numbers:
+            return
+        # Slots taken without a pick leave entries behind; compact once they dominate
+        if len(self.lowest) > 2 * len(self.numbers) + 8:
+            self.rebuild_heaps()
+        number = self.numbers[slot_id]
+        self.last_used[slot_id] = released_at
+        heapq.heappush(self.lowest, (number, slot_id))
+        heapq.heappush(self.lru, (released_at, number, slot_id))
+        heapq.heappush(self.floor_heaps[self.floors[slot_id]], (number, slot_id))
+
+    def pick(self, strategy, usable):
+        if strategy == 'lru':
+            return _pick(self.lru, self.source, usable, lambda entry: entry[0] == self.last_used[entry[-1]])
+        if strategy == 'floor_round_robin':
+            floors = len(self.floor_order)
+            for step in range(floors):
+                index = (self.next_floor + step) % floors
+                slot_id = _pick(self.floor_heaps[self.floor_order[index]], self.source, usable)
+                if slot_id is not None:
+                    self.next_floor = (index + 1) % floors
+                    return slot_id
+            return None
+        return _pick(self.lowest, self.source, usable)
+
+
+class SlotAllocator:
+    def __init__(self, slots_per_floor=DEFAULT_SLOTS_PER_FLOOR):
+        self.slots_per_floor = slots_per_floor
+        self._lock = threading.Lock()
+        self._zones = {}
+        self._cities = None
+
+    def _load_zone(self, zone_id, source):
+        rows = db.session.execute(
+            select(ParkingSlot.id, ParkingSlot.slot_number).where(ParkingSlot.zone_id == zone_id)
+        ).all()
+        positions = source.positions
+        numbers = {slot_id: slot_number_key(slot_number, positions.get(slot_id, 0) + 1)
+                   for slot_id, slot_number in rows if slot_id in positions}
+        last_used = dict.fromkeys(numbers, datetime.min)
+        released = db.session.execute(
+            select(Booking.slot_id, func.max(Booking.end_time))
+            .join(ParkingSlot, Booking.slot_id == ParkingSlot.id)
+            .where(ParkingSlot.zone_id == zone_id, Booking.status == 'completed')
+            .group_by(Booking.slot_id)
+        )
+        for slot_id, end_time in released:
+            if slot_id in last_used and end_time is not None:
+                last_used[slot_id] = end_time
+        return ZoneSlots(source, numbers, last_used, self.slots_per_floor)
+
+    def _zone(self, zone_id):
+        source = occupancy.get(zone_id)
+        if source is None:
+            return None
+        zone = self._zones.get(zone_id)
+        if zone is None or zone.source is not source:
+            zone = self._zones[zone_id] = self._load_zone(zone_id, source)
+        return zone
+
+    def _city_zones(self, zone_id):
+        if self._cities is None:
+            self._cities = dict(db.session.execute(select(ParkingZone.id, ParkingZone.city)).all())
+        city = self._cities.get(zone_id)
+        return [other for other, other_city in self._cities.items() if other_city == city] or [zone_id]
+
+    def pick(self, zone_id, strategy=DEFAULT_STRATEGY, usable=lambda slot_id: True):
+        """``(zone_id, slot_id)`` of the slot ``strategy`` would book next, or None.
+
+        ``usable`` filters out slots the caller cannot take (already lost
+        a race for, reserved). The slot is not removed; the caller claims it
+        and the occupancy index reports the change.
+        """
+        with self._lock:
+            if strategy != 'city_spread':
+                zone = self._zone(zone_id)
+                slot_id = zone.pick(strategy, usable) if zone else None
+                return None if slot_id is None else (zone_id, slot_id)
+
+            # Emptiest lot (by share of free slots) first; the requested lot wins ties
+            candidates = []
+            for other in self._city_zones(zone_id):
+                free, total = occupancy.free_count(other), occupancy.total_count(other)
+                if free:
+                    candidates.append((-free / total, other != zone_id, other))
+            for _, _, other in sorted(candidates):
+                zone = self._zone(other)
+                slot_id = zone.pick('lowest', usable) if zone else None
+                if slot_id is not None:
+                    return other, slot_id
+            return None
+
+    def slot_changed(self, zone_id, slot_id, is_available):
+        if not is_available:
+            return
+        with self._lock:
+            zone = self._zones.get(zone_id)
+            if zone is not None and zone.source is occupancy.get(zone_id):
+                zone.push(slot_id, datetime.utcnow())
+
+    def zone_changed(self, zone_id, free, total):
+        # A new or dropped lot changes which lots share a city
+        if self._cities is not None and (zone_id not in self._cities or not total):
+            self.forget_cities()
+
+    def forget_cities(self):
+        with self._lock:
+            self._cities = None
+
+
+allocator = SlotAllocator()
+occupancy.add_slot_listener(allocator.slot_changed)
+occupancy.add_listener(allocator.zone_changed)
+
+
+def init_allocation(app):
+    app.config.setdefault('ALLOCATION_STRATEGY', DEFAULT_STRATEGY)
+    app.config.setdefault('SLOTS_PER_FLOOR', DEFAULT_SLOTS_PER_FLOOR)
+    if app.config['ALLOCATION_STRATEGY'] not in STRATEGIES:
+        raise ValueError(f"ALLOCATION_STRATEGY must be one of: {', '.join(STRATEGIES)}")
+    allocator.slots_per_floor = app.config['SLOTS_PER_FLOOR']
+    return allocator
@@ -0,0 +1,143 @@
+"""Per-zone occupancy analytics computed from booking intervals.
+
+Each (zone, day) is reduced to 24 hourly bins of occupied slot-hours plus
+dwell totals by clipping every overlapping booking interval to the hour
+edges with NumPy. Days that have ended can no longer change, so their
+results are kept in an LRU and never recomputed; today is always fresh.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+from models import db, Booking, ParkingSlot
+from occupancy import occupancy
+
+CACHE_SIZE = 8192  # (zone, day) entries
+MAX_RANGE_DAYS = 366
+PEAK_HOURS = 3
+
+_HOUR = np.timedelta64(1, 'h')
+_HOUR_OFFSETS = np.arange(25) * _HOUR
+
+
+class DayCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._days = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            stats = self._days.get(key)
+            if stats is not None:
+                self._days.move_to_end(key)
+            return stats
+
+    def put(self, key, stats):
+        with self._lock:
+            self._days[key] = stats
+            self._days.move_to_end(key)
+            while len(self._days) > self.maxsize:
+                self._days.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+
+
+day_cache = DayCache()
+
+
+def _load_intervals(zone_id, start, end, now):
+    """Start/end arrays for the zone's bookings overlapping ``[start, end)``.
+
+    Bookings still running are counted up to ``now`` only; reservations
+    that have not started and cancelled bookings are left out.
+    """
+    rows = db.session.execute(
+        select(Booking.start_time, Booking.end_time)
+        .join(ParkingSlot, Booking.slot_id == ParkingSlot.id)
+        .where(ParkingSlot.zone_id == zone_id, Booking.status.in_(('active', 'completed')),
+               Booking.start_time < end, Booking.end_time > start)
+    ).all()
+    if not rows:
+        empty = np.array([], dtype='datetime64[us]')
+        return empty, empty
+    starts, ends = zip(*rows)
+    starts = np.asarray(starts, dtype='datetime64[us]')
+    ends = np.minimum(np.asarray(ends, dtype='datetime64[us]'), np.datetime64(now, 'us'))
+    return starts, ends
+
+
+def _day_stats(starts, ends, day):
+    """Hourly occupied slot-hours and dwell totals for one calendar day."""
+    edges = np.datetime64(day, 'us') + _HOUR_OFFSETS
+    # (bookings x 24) overlap of every interval with every hour bin
+    overlap = np.minimum(ends[:, None], edges[None, 1:]) - np.maximum(starts[:, None], edges[None, :-1])
+    hourly = np.clip(overlap / _HOUR, 0.0, None).sum(axis=0)
+
+    started = (starts >= edges[0]) & (starts < edges[-1])
+    dwell = np.clip((ends[started] - starts[started]) / _HOUR, 0.0, None)
+    return {
+        'hourly': hourly.tolist(),
+        'bookings': int(started.sum()),
+        'dwell_hours': float(dwell.sum()),
+    }
+
+
+def zone_days(zone_id, first_day, last_day, now=None):
+    """Per-day stats for ``first_day..last_day`` (inclusive dates), using the cache for closed days."""
+    now = now or datetime.utcnow()
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    stats = {day: day_cache.get((zone_id, day)) for day in days}
+
+    missing = [day for day, cached in stats.items() if cached is None]
+    if missing:
+        # One query covers every uncached day; the arrays are then sliced per day
+        span_start = datetime.combine(missing[0], datetime.min.time())
+        span_end = datetime.combine(missing[-1], datetime.min.time()) + timedelta(days=1)
+        starts, ends = _load_intervals(zone_id, span_start, span_end, now)
+        for day in missing:
+            day_start = datetime.combine(day, datetime.min.time())
+            if day_start > now:
+                stats[day] = {'hourly': [0.0] * 24, 'bookings': 0, 'dwell_hours': 0.0}
+                continue
+            day_end = day_start + timedelta(days=1)
+            mask = (starts < np.datetime64(day_end, 'us')) & (ends > np.datetime64(day_start, 'us'))
+            stats[day] = _day_stats(starts[mask], ends[mask], day_start)
+            if day_end <= now:
+                day_cache.put((zone_id, day), stats[day])
+    return [(day, stats[day]) for day in days]
+
+
+def zone_occupancy(zone, first_day, last_day, now=None):
+    """Hourly occupancy histogram, peak hours and average dwell for a zone over a date range."""
+    days = zone_days(zone.id, first_day, last_day, now)
+    slots = occupancy.total_count(zone.id)
+
+    # Mean occupied slots for each hour of the day across the range
+    hourly = np.mean([stats['hourly'] for _, stats in days], axis=0)
+    bookings = sum(stats['bookings'] for _, stats in days)
+    dwell_hours = sum(stats['dwell_hours'] for _, stats in days)
+    peaks = np.argsort(-hourly, kind='stable')[:PEAK_HOURS]
+
+    return {
+        'zone_id': zone.id,
+        'name': zone.name,
+        'city': zone.city,
+        'slots': slots,
+        'bookings': bookings,
+        'average_dwell_hours': round(dwell_hours / bookings, 2) if bookings else 0.0,
+        'hourly': [{
+            'hour': hour,
+            'occupied': round(float(value), 2),
+            'utilisation': round(float(value) / slots, 4) if slots else 0.0
+        } for hour, value in enumerate(hourly)],
+        'peak_hours': [int(hour) for hour in peaks if hourly[hour] > 0],
+        'daily': [{
+            'date': day.isoformat(),
+            'occupied_slot_hours': round(sum(stats['hourly']), 2),
+            'bookings': stats['bookings']
+        } for day, stats in days]
+    }
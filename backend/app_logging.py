@@ -0,0 +1,153 @@
+"""Structured, non-blocking logging for the web process.
+
+Log calls on request threads only copy the record onto a bounded queue;
+a single listener thread formats it as one JSON line and writes it out.
+If the queue is full the record is dropped and counted rather than
+making the request wait. Every record carries the request's correlation
+id (taken from ``X-Request-ID`` or generated), which is also echoed back
+in the response.
+
+High-volume events can be sampled per call::
+
+    log.info('booked slot %s', slot_id, extra=sampled(0.01))
+
+Levels come from ``LOG_LEVEL`` and per-logger overrides in ``LOG_LEVELS``
+(``"parking.sweeper=WARNING,parking.requests=DEBUG"``).
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request
+
+ROOT_LOGGER = 'parking'
+DEFAULT_LEVEL = 'INFO'
+DEFAULT_REQUEST_LOG_SAMPLE = 0.01
+QUEUE_SIZE = 10000
+
+_request_id = ContextVar('request_id', default='-')
+
+
+def get_logger(name=None):
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}' if name else ROOT_LOGGER)
+
+
+def sampled(rate):
+    """``extra`` for a log call that should only be emitted ``rate`` of the time."""
+    return {'sample_rate': rate}
+
+
+class ContextFilter(logging.Filter):
+    """Drops unsampled records and stamps the rest with the current request id."""
+
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', 1.0)
+        if rate < 1 and random.random() >= rate:
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Message formatting happens on the listener thread; only tracebacks,
+        # which reference live frames, are rendered here
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_handler = None
+_listener = None
+
+
+def init_logging(app, stream=None):
+    global _handler, _listener
+    app.config.setdefault('LOG_LEVEL', DEFAULT_LEVEL)
+    app.config.setdefault('LOG_LEVELS', '')
+    app.config.setdefault('REQUEST_LOG_SAMPLE', DEFAULT_REQUEST_LOG_SAMPLE)
+
+    root = get_logger()
+    root.setLevel(app.config['LOG_LEVEL'].upper())
+    for name, level in _parse_levels(app.config['LOG_LEVELS']).items():
+        logging.getLogger(name).setLevel(level)
+
+    if _handler is None:
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        _handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        _handler.addFilter(ContextFilter())
+        root.addHandler(_handler)
+        root.propagate = False
+        _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    requests_log = get_logger('requests')
+    request_sample = app.config['REQUEST_LOG_SAMPLE']
+
+    @app.before_request
+    def assign_request_id():
+        g.request_started = time.perf_counter()
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_id_token = _request_id.set(g.request_id)
+
+    @app.after_request
+    def log_request(response):
+        if 'request_id' not in g:
+            return response
+        response.headers['X-Request-ID'] = g.request_id
+        requests_log.info('%s %s %s %.1fms', request.method, request.path, response.status_code,
+                          (time.perf_counter() - g.request_started) * 1000, extra=sampled(request_sample))
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            _request_id.reset(token)
+
+
+def dropped_records():
+    return _handler.dropped if _handler else 0
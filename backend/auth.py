@@ -0,0 +1,104 @@
+"""Role checks from JWT claims and a short-lived principal cache.
+
+The login routes sign a ``role`` claim into every token, so
+``role_required`` authorizes a request from the verified token alone,
+without a database query. Endpoints that need the account's details use
+``current_principal()``, which keeps a read-only snapshot of the row for
+``PRINCIPAL_TTL`` seconds; handlers that change or delete an account call
+``invalidate_principal`` so the next lookup reloads it.
+
+A token stays valid for its role until it expires even if the account
+is deleted in the meantime; ``current_principal()`` returns None for such
+tokens.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from models import db, User, Admin
+
+PRINCIPAL_TTL = 60  # seconds
+PRINCIPAL_CACHE_SIZE = 4096
+
+MODELS = {'user': User, 'admin': Admin}
+FORBIDDEN = {
+    ('admin',): 'Admin access required',
+    ('user',): 'User access required',
+}
+
+Principal = namedtuple('Principal', 'id role email fullname address pincode')
+
+
+def current_role():
+    return get_jwt().get('role')
+
+
+def role_required(*roles, **jwt_options):
+    """``jwt_required`` plus a check that the token's role claim is one of ``roles``."""
+    def decorator(view):
+        @wraps(view)
+        @jwt_required(**jwt_options)
+        def wrapper(*args, **kwargs):
+            if current_role() not in roles:
+                return jsonify({'error': FORBIDDEN.get(roles, 'Access denied')}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PrincipalCache:
+    def __init__(self, ttl=PRINCIPAL_TTL, maxsize=PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, principal):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+principal_cache = PrincipalCache()
+
+
+def load_principal(role, principal_id):
+    key = (role, principal_id)
+    entry = principal_cache.get(key)
+    if entry is not None:
+        return entry[1]
+    model = MODELS.get(role)
+    row = db.session.get(model, principal_id) if model else None
+    principal = None if row is None else Principal(
+        row.id, role, row.email, row.fullname, row.address, row.pincode)
+    # Missing accounts are cached too, so a stale token cannot force a query per request
+    principal_cache.put(key, principal)
+    return principal
+
+
+def current_principal():
+    """The (cached) account behind the current token, or None if it no longer exists."""
+    return load_principal(current_role(), int(get_jwt_identity()))
+
+
+def invalidate_principal(role, principal_id):
+    principal_cache.invalidate((role, principal_id))
@@ -0,0 +1,113 @@
+"""Compare slot allocation strategies: pick latency against a table query, and how evenly slots are used.
+
+    python benchmarks/bench_allocation.py --spots 2000 --cycles 2000
+"""
+import argparse
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+
+from bench_app import make_app, seed_zone, seed_users, percentile
+from sqlalchemy import update
+from models import db, Booking, ParkingSlot
+from occupancy import occupancy
+from allocation import allocator, init_allocation, STRATEGIES
+from reservations import reservations
+from booking_engine import book_spot
+
+
+def release(booking):
+    booking.status = 'completed'
+    booking.end_time = datetime.utcnow()
+    booking.slot.is_available = True
+    db.session.commit()
+    occupancy.mark_free(booking.slot.zone_id, booking.slot_id)
+    reservations.remove(booking.id)
+
+
+def reset(zone_id, occupied):
+    """Free every slot, then occupy a random ``occupied`` share of the lot."""
+    db.session.execute(update(Booking).where(Booking.status == 'active').values(status='completed'))
+    db.session.execute(update(ParkingSlot).values(is_available=True))
+    slot_ids = [slot_id for (slot_id,) in db.session.query(ParkingSlot.id).filter_by(zone_id=zone_id)]
+    taken = random.sample(slot_ids, int(len(slot_ids) * occupied))
+    if taken:
+        db.session.execute(update(ParkingSlot).where(ParkingSlot.id.in_(taken)).values(is_available=False))
+    db.session.commit()
+    occupancy.rebuild()
+    reservations.rebuild()
+
+
+def pick_latency(zone_id, strategy, picks):
+    samples = []
+    for _ in range(picks):
+        t0 = time.perf_counter()
+        allocator.pick(zone_id, strategy)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def sql_latency(zone_id, picks):
+    samples = []
+    for _ in range(picks):
+        t0 = time.perf_counter()
+        db.session.query(ParkingSlot.id).filter(
+            ParkingSlot.zone_id == zone_id, ParkingSlot.is_available.is_(True)).order_by(ParkingSlot.id).first()
+        samples.append(time.perf_counter() - t0)
+        db.session.rollback()
+    return samples
+
+
+def wear(zone_id, strategy, cycles, parked):
+    """Book and release ``cycles`` times with ``parked`` cars on site; returns uses per slot."""
+    uses = Counter()
+    on_site = []
+    for i in range(cycles):
+        booking = book_spot(1, zone_id, f'WEAR-{i}', strategy=strategy)
+        uses[booking.slot_id] += 1
+        on_site.append(booking)
+        if len(on_site) > parked:
+            release(on_site.pop(random.randrange(len(on_site))))
+    for booking in on_site:
+        release(booking)
+    return uses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--spots', type=int, default=2000)
+    parser.add_argument('--occupied', type=float, default=0.9, help='Share of the lot taken before picking.')
+    parser.add_argument('--picks', type=int, default=500)
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--parked', type=int, default=20, help='Cars on site during the wear run.')
+    args = parser.parse_args()
+
+    app, db_path = make_app(SLOTS_PER_FLOOR=100)
+    init_allocation(app)
+    with app.app_context():
+        seed_users(1)
+        zone_id = seed_zone(args.spots)
+        seed_zone(args.spots, name='Bench Lot 2')
+
+        print(f"spots={args.spots} occupied={args.occupied:.0%} picks={args.picks}")
+        reset(zone_id, args.occupied)
+        samples = sql_latency(zone_id, args.picks)
+        print(f"{'sql':>18}: p50={percentile(samples, 50) * 1e6:.0f}us p99={percentile(samples, 99) * 1e6:.0f}us")
+        for strategy in STRATEGIES:
+            reset(zone_id, args.occupied)
+            allocator.pick(zone_id, strategy)  # first use builds the zone's heaps
+            samples = pick_latency(zone_id, strategy, args.picks)
+            print(f"{strategy:>18}: p50={percentile(samples, 50) * 1e6:.0f}us p99={percentile(samples, 99) * 1e6:.0f}us")
+
+        print(f"wear: cycles={args.cycles} parked={args.parked}")
+        for strategy in STRATEGIES:
+            reset(zone_id, 0)
+            uses = wear(zone_id, strategy, args.cycles, args.parked)
+            print(f"{strategy:>18}: slots used={len(uses)} max uses per slot={max(uses.values())}")
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Shared setup for the benchmark scripts: a throwaway Flask app on a temp SQLite file."""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, ParkingZone, ParkingSlot
+from migrations import upgrade
+from database import init_database
+
+
+def make_app(db_path=None, **config):
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='parking-bench-')
+        os.close(fd)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config.update(config)
+    init_database(app)
+    with app.app_context():
+        upgrade()
+    return app, db_path
+
+
+def seed_zone(spots, name='Bench Lot', city='Bench City', pincode='560001', price=20.0):
+    zone = ParkingZone(name=name, city=city)
+    db.session.add(zone)
+    db.session.flush()
+    db.session.add_all([
+        ParkingSlot(location=city, slot_number=f'{name}-{i + 1}', price_per_hour=price,
+                    pincode=pincode, zone_id=zone.id)
+        for i in range(spots)
+    ])
+    db.session.commit()
+    return zone.id
+
+
+def seed_users(count):
+    db.session.add_all([
+        User(email=f'bench{i}@example.com', password='bench', fullname=f'Bench {i}')
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
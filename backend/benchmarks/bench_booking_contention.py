@@ -0,0 +1,82 @@
+"""Hammer one lot from many threads and check that no slot is ever double-booked.
+
+    python benchmarks/bench_booking_contention.py --threads 16 --spots 200
+"""
+import argparse
+import os
+import threading
+import time
+
+from bench_app import make_app, seed_zone, seed_users, percentile
+from sqlalchemy import func
+from models import db, Booking
+from occupancy import occupancy
+from booking_engine import book_spot, NoSpotAvailable, BookingContention
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--spots', type=int, default=200)
+    parser.add_argument('--attempts-per-thread', type=int, default=50)
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    with app.app_context():
+        seed_users(args.threads)
+        zone_id = seed_zone(args.spots)
+        occupancy.rebuild()
+
+    latencies = []
+    outcomes = {'booked': 0, 'full': 0, 'contention': 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(args.threads)
+
+    def worker(user_id):
+        local_latencies = []
+        local = {'booked': 0, 'full': 0, 'contention': 0}
+        with app.app_context():
+            start_barrier.wait()
+            for i in range(args.attempts_per_thread):
+                t0 = time.perf_counter()
+                try:
+                    book_spot(user_id, zone_id, f'BENCH-{user_id}-{i}')
+                    local['booked'] += 1
+                except NoSpotAvailable:
+                    local['full'] += 1
+                except BookingContention:
+                    local['contention'] += 1
+                local_latencies.append(time.perf_counter() - t0)
+            db.session.remove()
+        with lock:
+            latencies.extend(local_latencies)
+            for key, value in local.items():
+                outcomes[key] += value
+
+    threads = [threading.Thread(target=worker, args=(i + 1,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        double_booked = db.session.query(Booking.slot_id).filter_by(status='active') \
+            .group_by(Booking.slot_id).having(func.count(Booking.id) > 1).count()
+        active = Booking.query.filter_by(status='active').count()
+
+    requests = sum(outcomes.values())
+    print(f"threads={args.threads} spots={args.spots} requests={requests}")
+    print(f"booked={outcomes['booked']} full={outcomes['full']} contention={outcomes['contention']}")
+    print(f"throughput={requests / elapsed:.1f} req/s "
+          f"p50={percentile(latencies, 50) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms")
+    print(f"active bookings={active} double-booked slots={double_booked}")
+    os.remove(db_path)
+
+    if double_booked or active != outcomes['booked'] or outcomes['booked'] > args.spots:
+        raise SystemExit('FAIL: booking invariant violated')
+
+
+if __name__ == '__main__':
+    main()
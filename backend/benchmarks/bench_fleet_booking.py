@@ -0,0 +1,85 @@
+"""Book fleets of vehicles with one ``book_fleet`` call versus one ``book_spot`` per vehicle.
+
+    python benchmarks/bench_fleet_booking.py --fleet 20 --rounds 10
+"""
+import argparse
+import os
+import time
+
+from bench_app import make_app, seed_zone, seed_users, percentile
+from sqlalchemy import event, update
+from models import db, Booking, ParkingSlot
+from occupancy import occupancy
+from booking_engine import book_spot, book_fleet
+from reservations import reservations
+
+
+def count_statements(engine):
+    counter = {'statements': 0}
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(*args):
+        counter['statements'] += 1
+    return counter
+
+
+def reset_lot():
+    """Free every slot again so each round starts from the same empty lot."""
+    db.session.execute(update(Booking).where(Booking.status == 'active').values(status='completed'))
+    db.session.execute(update(ParkingSlot).values(is_available=True))
+    db.session.commit()
+    occupancy.rebuild()
+    reservations.rebuild()
+
+
+def run(label, rounds, fleet, book, counter):
+    latencies = []
+    statements = 0
+    for round_no in range(rounds):
+        vehicles = [f'FLEET-{round_no}-{i}' for i in range(fleet)]
+        before = counter['statements']
+        t0 = time.perf_counter()
+        book(vehicles)
+        latencies.append(time.perf_counter() - t0)
+        statements += counter['statements'] - before
+        reset_lot()
+    print(f"{label:>8}: p50={percentile(latencies, 50) * 1000:.2f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.2f}ms statements/fleet={statements / rounds:.0f}")
+    return percentile(latencies, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fleet', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--spots', type=int, default=200)
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    with app.app_context():
+        seed_users(1)
+        zone_id = seed_zone(args.spots)
+        occupancy.rebuild()
+        counter = count_statements(db.engine)
+
+        def singles(vehicles):
+            for vehicle in vehicles:
+                book_spot(1, zone_id, vehicle)
+
+        def fleet(vehicles):
+            book_fleet(1, vehicles, zone_ids=[zone_id])
+
+        print(f"fleet={args.fleet} rounds={args.rounds} spots={args.spots}")
+        single_p50 = run('single', args.rounds, args.fleet, singles, counter)
+        fleet_p50 = run('fleet', args.rounds, args.fleet, fleet, counter)
+        print(f"speedup={single_p50 / fleet_p50:.1f}x")
+        book_fleet(1, [f'CHECK-{i}' for i in range(args.fleet)], zone_ids=[zone_id])
+        booked = Booking.query.filter_by(status='active').count()
+    os.remove(db_path)
+
+    if booked != args.fleet:
+        raise SystemExit('FAIL: fleet booking did not book every vehicle')
+
+
+if __name__ == '__main__':
+    main()
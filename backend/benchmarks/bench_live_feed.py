@@ -0,0 +1,57 @@
+"""Fan-out of availability events to many idle feed subscribers.
+
+    python benchmarks/bench_live_feed.py --subscribers 2000 --events 200
+
+Subscribers are plain threads here; under a gevent worker they are
+greenlets. Reports how long each publish takes and how long until every
+subscriber has seen the last event.
+"""
+import argparse
+import threading
+import time
+
+import bench_app  # noqa: F401  (puts the backend on sys.path)
+from bench_app import percentile
+from live_feed import AvailabilityFeed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--zones', type=int, default=50)
+    args = parser.parse_args()
+
+    feed = AvailabilityFeed()
+    caught_up = threading.Barrier(args.subscribers + 1)
+    seen = [0] * args.subscribers
+
+    def subscriber(i):
+        seq = 0
+        while seq < args.events:
+            seq, zones = feed.changes_since(seq, 5)
+            seen[i] = seq
+        caught_up.wait()
+
+    threading.stack_size(256 * 1024)
+    threads = [threading.Thread(target=subscriber, args=(i,), daemon=True) for i in range(args.subscribers)]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)
+
+    publish_ms = []
+    started = time.perf_counter()
+    for n in range(args.events):
+        t0 = time.perf_counter()
+        feed.publish(n % args.zones, n % 7, 10)
+        publish_ms.append((time.perf_counter() - t0) * 1000)
+    caught_up.wait()
+    elapsed = time.perf_counter() - started
+
+    print(f'subscribers={args.subscribers} events={args.events} '
+          f'publish p50={percentile(publish_ms, 50):.3f}ms p99={percentile(publish_ms, 99):.3f}ms')
+    print(f'all subscribers caught up in {elapsed:.2f}s; min seq seen={min(seen)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Login throughput at several password hashing costs.
+
+    python benchmarks/bench_login.py --threads 32 --logins 200 --costs 12 13 14 15
+
+Request threads look the account up and verify the password through the
+bounded hashing pool, as the login routes do. Logins that find the pool
+saturated are counted as "busy" (the routes answer those with 503).
+"""
+import argparse
+import os
+import threading
+import time
+
+from bench_app import make_app, percentile
+from models import db, User
+from passwords import PasswordHasher, HasherBusy, DEFAULT_WORKERS, DEFAULT_QUEUE
+
+PASSWORD = 'correct horse battery staple'
+
+
+def run(app, cost, args):
+    hasher = PasswordHasher(cost, args.workers, args.queue)
+    with app.app_context():
+        User.query.delete()
+        stored = hasher.hash(PASSWORD)
+        db.session.add_all([User(email=f'login{i}@example.com', password=stored, fullname=f'Login {i}')
+                            for i in range(args.threads)])
+        db.session.commit()
+
+    latencies = []
+    outcomes = {'ok': 0, 'busy': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def client(i):
+        local = []
+        ok = busy = 0
+        with app.app_context():
+            barrier.wait()
+            for _ in range(args.logins // args.threads):
+                t0 = time.perf_counter()
+                user = User.query.filter_by(email=f'login{i}@example.com').first()
+                try:
+                    matches, _ = hasher.verify(user.password, PASSWORD)
+                    ok += matches
+                except HasherBusy:
+                    busy += 1
+                db.session.rollback()
+                local.append(time.perf_counter() - t0)
+            db.session.remove()
+        with lock:
+            latencies.extend(local)
+            outcomes['ok'] += ok
+            outcomes['busy'] += busy
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return outcomes, elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=256)
+    parser.add_argument('--costs', type=int, nargs='+', default=[12, 13, 14, 15])
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE)
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    print(f'threads={args.threads} hash workers={args.workers} queue={args.queue}')
+    for cost in args.costs:
+        outcomes, elapsed, latencies = run(app, cost, args)
+        print(f"cost={cost} (N={2 ** cost:<6}) logins/sec={outcomes['ok'] / elapsed:7.1f} busy={outcomes['busy']} "
+              f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms")
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Time the vectorized booking repricing over a large synthetic history.
+
+    python benchmarks/bench_reprice.py --bookings 500000
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+from bench_app import make_app, seed_zone, seed_users
+from models import db, Booking
+from pricing import reprice_bookings, booking_cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bookings', type=int, default=200000)
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    with app.app_context():
+        seed_users(10)
+        seed_zone(50)
+        base = datetime(2025, 1, 1)
+        rows = []
+        for i in range(args.bookings):
+            start = base + timedelta(minutes=random.randrange(0, 500000))
+            rows.append({
+                'user_id': random.randint(1, 10), 'slot_id': random.randint(1, 50),
+                'vehicle_number': f'BENCH-{i}', 'start_time': start,
+                'end_time': start + timedelta(minutes=random.randrange(5, 600)),
+                'status': 'completed', 'created_at': start
+            })
+        db.session.execute(Booking.__table__.insert(), rows)
+        db.session.commit()
+
+        with db.engine.begin() as conn:
+            stats = reprice_bookings(conn, multiplier=1.5)
+        print(f"repriced {stats['bookings']} bookings in {stats['seconds']}s "
+              f"({stats['bookings'] / max(stats['seconds'], 1e-9):.0f} bookings/s)")
+
+        sample = Booking.query.order_by(db.func.random()).limit(100).all()
+        mismatched = [b.id for b in sample
+                      if abs(b.cost - booking_cost(b.start_time, b.end_time, b.slot.price_per_hour * 1.5)) > 0.011]
+    os.remove(db_path)
+    if mismatched:
+        raise SystemExit(f'FAIL: vectorized cost differs from booking_cost for {mismatched}')
+
+
+if __name__ == '__main__':
+    main()
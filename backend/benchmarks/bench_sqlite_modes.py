@@ -0,0 +1,124 @@
+"""Read/write throughput of the app's workload under different SQLite settings.
+
+    python benchmarks/bench_sqlite_modes.py --writers 4 --readers 8 --seconds 5
+
+Writers book and release spots through the booking engine; readers run
+the lot listing and reservation queries. Each configuration gets a fresh
+database file. "locked" counts writes that failed with "database is
+locked" despite the retries.
+"""
+import argparse
+import os
+import threading
+import time
+
+from bench_app import make_app, seed_zone, seed_users, percentile
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from models import db, Booking, ParkingSlot, ParkingZone
+from occupancy import occupancy
+from booking_engine import book_spot, NoSpotAvailable, BookingContention
+from reservations import reservations
+
+CONFIGS = [
+    ('rollback journal, synchronous=FULL', {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'}),
+    ('WAL, synchronous=FULL', {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'FULL'}),
+    ('WAL, synchronous=NORMAL', {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'}),
+]
+
+
+def release(booking):
+    booking.status = 'completed'
+    booking.end_time = booking.start_time
+    booking.slot.is_available = True
+    db.session.commit()
+    occupancy.mark_free(booking.slot.zone_id, booking.slot_id)
+    reservations.remove(booking.id)
+
+
+def run(config, args):
+    app, db_path = make_app(SQLITE_BUSY_TIMEOUT_MS=args.busy_timeout_ms, **config)
+    with app.app_context():
+        seed_users(args.writers + args.readers)
+        zone_id = seed_zone(args.spots)
+        occupancy.rebuild()
+        reservations.rebuild()
+
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    write_latencies = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + args.seconds
+
+    def writer(user_id):
+        local = {'writes': 0, 'locked': 0}
+        latencies = []
+        with app.app_context():
+            i = 0
+            while time.perf_counter() < stop:
+                t0 = time.perf_counter()
+                try:
+                    release(book_spot(user_id, zone_id, f'BENCH-{user_id}-{i}'))
+                    local['writes'] += 2
+                except (NoSpotAvailable, BookingContention):
+                    db.session.rollback()
+                except OperationalError:
+                    db.session.rollback()
+                    local['locked'] += 1
+                latencies.append(time.perf_counter() - t0)
+                i += 1
+            db.session.remove()
+        with lock:
+            write_latencies.extend(latencies)
+            for key, value in local.items():
+                counts[key] += value
+
+    def reader(user_id):
+        reads = 0
+        with app.app_context():
+            while time.perf_counter() < stop:
+                db.session.query(ParkingZone.id, func.count(ParkingSlot.id)) \
+                    .join(ParkingSlot, ParkingSlot.zone_id == ParkingZone.id) \
+                    .filter(ParkingSlot.is_available.is_(True)).group_by(ParkingZone.id).all()
+                Booking.query.filter_by(user_id=user_id).order_by(Booking.start_time.desc()).limit(50).all()
+                db.session.rollback()
+                reads += 2
+            db.session.remove()
+        with lock:
+            counts['reads'] += reads
+
+    threads = [threading.Thread(target=writer, args=(i + 1,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(args.writers + i + 1,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return counts, write_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--spots', type=int, default=100)
+    parser.add_argument('--busy-timeout-ms', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f'writers={args.writers} readers={args.readers} seconds={args.seconds} '
+          f'busy_timeout={args.busy_timeout_ms}ms')
+    for name, config in CONFIGS:
+        counts, latencies = run(config, args)
+        print(f"{name:<36} reads={counts['reads'] / args.seconds:8.1f}/s "
+              f"writes={counts['writes'] / args.seconds:7.1f}/s locked={counts['locked']} "
+              f"book+release p50={percentile(latencies, 50) * 1000:.1f}ms "
+              f"p99={percentile(latencies, 99) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Answer "which slots are free for [t1, t2)" from the slot schedules versus an SQL overlap query.
+
+    python benchmarks/bench_window_availability.py --spots 500 --windows 200
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from bench_app import make_app, seed_zone, seed_users, percentile
+from sqlalchemy import select, exists, and_
+from models import db, Booking, ParkingSlot
+from occupancy import occupancy
+from reservations import reservations, free_slots, HOLDING_STATUSES
+
+
+def seed_reservations(zone_id, windows, start):
+    # Back-to-back two-hour windows with random gaps, so no slot has overlapping bookings
+    rows = []
+    for slot_id in db.session.scalars(select(ParkingSlot.id).where(ParkingSlot.zone_id == zone_id)):
+        at = start
+        for _ in range(windows):
+            at += timedelta(hours=random.randint(0, 4))
+            rows.append(Booking(user_id=1, slot_id=slot_id, vehicle_number='BENCH', status='reserved',
+                                start_time=at, end_time=at + timedelta(hours=2)))
+            at += timedelta(hours=2)
+    db.session.add_all(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def sql_free_slots(zone_id, t1, t2):
+    overlapping = exists().where(and_(
+        Booking.slot_id == ParkingSlot.id, Booking.status.in_(HOLDING_STATUSES),
+        Booking.start_time < t2, Booking.end_time > t1))
+    return list(db.session.scalars(
+        select(ParkingSlot.id).where(ParkingSlot.zone_id == zone_id, ~overlapping).order_by(ParkingSlot.id)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--spots', type=int, default=500)
+    parser.add_argument('--windows', type=int, default=200, help='Reservations per slot.')
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    with app.app_context():
+        seed_users(1)
+        zone_id = seed_zone(args.spots)
+        start = datetime.utcnow() + timedelta(days=1)
+        total = seed_reservations(zone_id, args.windows, start)
+        occupancy.rebuild()
+        t0 = time.perf_counter()
+        reservations.rebuild()
+        rebuild_ms = (time.perf_counter() - t0) * 1000
+
+        horizon = args.windows * 4
+        windows = []
+        for _ in range(args.queries):
+            t1 = start + timedelta(hours=random.uniform(0, horizon))
+            windows.append((t1, t1 + timedelta(hours=random.uniform(0.5, 3))))
+
+        timings = {'schedule': [], 'sql': []}
+        for t1, t2 in windows:
+            t0 = time.perf_counter()
+            from_schedule = free_slots(zone_id, t1, t2)
+            timings['schedule'].append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            from_sql = sql_free_slots(zone_id, t1, t2)
+            timings['sql'].append(time.perf_counter() - t0)
+            if from_schedule != from_sql:
+                raise SystemExit(f'FAIL: schedule and SQL disagree for [{t1}, {t2})')
+    os.remove(db_path)
+
+    print(f"spots={args.spots} reservations={total} queries={args.queries} rebuild={rebuild_ms:.0f}ms")
+    for name, samples in timings.items():
+        print(f"{name:>8}: p50={percentile(samples, 50) * 1000:.2f}ms p99={percentile(samples, 99) * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
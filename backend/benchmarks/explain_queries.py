@@ -0,0 +1,98 @@
+"""Run EXPLAIN QUERY PLAN over the endpoints' hot queries and fail on table scans.
+
+    python benchmarks/explain_queries.py
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+from bench_app import make_app, seed_zone, seed_users
+from sqlalchemy import select, text
+from sqlalchemy.dialects import sqlite
+from models import db, ParkingSlot, Booking, Payment, User
+from reservations import HOLDING_STATUSES
+
+# A bare SCAN, or a walk over a whole index with no (column=?) constraint
+TABLE_SCAN = re.compile(r'\bSCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$')
+
+
+def hot_queries():
+    now = datetime.utcnow()
+    return {
+        'api_book_spot': db.session.query(ParkingSlot.id).filter(
+            ParkingSlot.zone_id == 1, ParkingSlot.is_available.is_(True)).limit(1),
+        'api_delete_lot': ParkingSlot.query.filter_by(zone_id=1, is_available=False),
+        'api_get_lot_spots': ParkingSlot.query.filter_by(zone_id=1),
+        'api_user_lot_spots': ParkingSlot.query.filter_by(zone_id=1, is_available=True),
+        'api_user_reservations': Booking.query.filter_by(user_id=1).order_by(Booking.start_time.desc()),
+        'api_export_csv': Booking.query.filter_by(user_id=1),
+        'booking.payment': Payment.query.filter_by(booking_id=1),
+        # reservations.booked_slots, the overlap recheck behind every booking and reservation
+        'booked_slots': select(Booking.slot_id).where(
+            Booking.slot_id.in_([1, 2, 3]), Booking.status.in_(HOLDING_STATUSES),
+            Booking.start_time < now + timedelta(hours=2), Booking.end_time > now),
+        # analytics._load_intervals
+        'api_admin_analytics': select(Booking.start_time, Booking.end_time)
+        .join(ParkingSlot, Booking.slot_id == ParkingSlot.id)
+        .where(ParkingSlot.zone_id == 1, Booking.status.in_(('active', 'completed')),
+               Booking.start_time < now, Booking.end_time > now - timedelta(days=7)),
+        # exports.admin_bookings_csv with a date range
+        'api_admin_export_csv': db.session.query(
+            Booking.id, User.email, ParkingSlot.slot_number, Payment.amount
+        ).join(User, Booking.user_id == User.id)
+        .outerjoin(ParkingSlot, Booking.slot_id == ParkingSlot.id)
+        .outerjoin(Payment, Payment.booking_id == Booking.id)
+        .filter(Booking.start_time >= now - timedelta(days=7), Booking.start_time < now)
+        .order_by(Booking.start_time, Booking.id),
+        'expired_bookings': Booking.query.filter(Booking.status == 'active', Booking.end_time < now),
+        'sweeper_slot_guard': Booking.query.filter_by(slot_id=1, status='active'),
+    }
+
+
+def seed_bookings(count, days=60):
+    # Enough history that the planner sees bookings outnumber users, as in production
+    now = datetime.utcnow()
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    slot_ids = [slot_id for (slot_id,) in db.session.query(ParkingSlot.id)]
+    rows = []
+    for i in range(count):
+        start = now - timedelta(days=days) + timedelta(minutes=i * days * 24 * 60 // count)
+        rows.append({'user_id': user_ids[i % len(user_ids)], 'slot_id': slot_ids[i % len(slot_ids)],
+                     'vehicle_number': f'BENCH{i}', 'start_time': start,
+                     'end_time': start + timedelta(hours=2), 'status': 'completed', 'cost': 40.0})
+    db.session.execute(Booking.__table__.insert(), rows)
+    db.session.commit()
+
+
+def explain(query):
+    # ORM queries and Core selects alike
+    statement = getattr(query, 'statement', query)
+    sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+def main():
+    app, db_path = make_app()
+    failures = []
+    with app.app_context():
+        seed_users(1000)
+        for i in range(5):
+            seed_zone(20, name=f'Lot {i}')
+        seed_bookings(5000)
+        db.session.execute(text('ANALYZE'))
+
+        for endpoint, query in hot_queries().items():
+            plan = explain(query)
+            scans = [line for line in plan if TABLE_SCAN.search(line)]
+            status = 'FAIL' if scans else 'ok'
+            print(f'{status:4} {endpoint}: {" | ".join(plan)}')
+            if scans:
+                failures.append(endpoint)
+    os.remove(db_path)
+
+    if failures:
+        raise SystemExit(f'FAIL: table scan in {", ".join(failures)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+from models import db, ParkingSlot, Booking
+from occupancy import occupancy
+from rollups import record_booking
+from capacity import record_slots_taken
+from reservations import reservations, booked_slots
+from allocation import allocator, DEFAULT_STRATEGY
+
+MAX_ATTEMPTS = 8
+BASE_DELAY = 0.002  # seconds
+MAX_DELAY = 0.05
+
+
+class NoSpotAvailable(Exception):
+    pass
+
+
+class BookingContention(Exception):
+    pass
+
+
+def _backoff(attempt):
+    # Full jitter keeps retrying writers from waking up in lockstep
+    delay = min(MAX_DELAY, BASE_DELAY * (2 ** attempt))
+    time.sleep(random.uniform(0, delay))
+
+
+def _candidate_slot(zone_id, skip, start, end, strategy):
+    """``(zone_id, slot_id)`` to try next: free right now and not reserved before the stay ends."""
+    def usable(slot_id):
+        return slot_id not in skip and reservations.is_free(slot_id, start, end)
+
+    if occupancy.get(zone_id) is not None:
+        return allocator.pick(zone_id, strategy, usable)
+
+    # A lot this process has not indexed yet (e.g. created by another worker)
+    query = db.session.query(ParkingSlot.id).filter(
+        ParkingSlot.zone_id == zone_id,
+        ParkingSlot.is_available.is_(True)
+    )
+    if skip:
+        query = query.filter(ParkingSlot.id.notin_(skip))
+    for (slot_id,) in query:
+        if reservations.is_free(slot_id, start, end):
+            return zone_id, slot_id
+    return None
+
+
+def try_claim(slot_id):
+    """Compare-and-swap ``is_available`` from true to false for one slot.
+
+    Returns True when this transaction won the slot. The caller owns the
+    surrounding transaction and must commit or roll back.
+    """
+    result = db.session.execute(
+        update(ParkingSlot)
+        .where(ParkingSlot.id == slot_id, ParkingSlot.is_available.is_(True))
+        .values(is_available=False)
+    )
+    return result.rowcount == 1
+
+
+def book_spot(user_id, zone_id, vehicle_number, duration=1, strategy=DEFAULT_STRATEGY):
+    """Claim a free slot in ``zone_id`` and create an active booking for it.
+
+    ``strategy`` names the allocation strategy that picks the slot (see
+    allocation.py); ``city_spread`` may book another lot in the same city.
+    The candidate comes from the in-memory indexes; once the slot is
+    claimed (which holds its write lock) the stay is rechecked against the
+    bookings table, so a reservation another request just made for the
+    same window is never double-sold.
+
+    Conflicts (another request took the candidate slot) and transient lock
+    errors are retried with bounded exponential backoff. Raises
+    ``NoSpotAvailable`` when the zone is full and ``BookingContention`` when
+    every attempt lost the race.
+    """
+    lost = set()
+    for attempt in range(MAX_ATTEMPTS):
+        now = datetime.utcnow()
+        end = now + timedelta(hours=duration)
+        candidate = _candidate_slot(zone_id, lost, now, end, strategy)
+        if candidate is None:
+            if lost:
+                # Everything we saw was taken underneath us; look again from scratch
+                lost.clear()
+                candidate = _candidate_slot(zone_id, lost, now, end, strategy)
+            if candidate is None:
+                raise NoSpotAvailable()
+        slot_zone_id, slot_id = candidate
+
+        try:
+            if not try_claim(slot_id):
+                db.session.rollback()
+                lost.add(slot_id)
+                occupancy.mark_taken(slot_zone_id, slot_id)
+                _backoff(attempt)
+                continue
+            if booked_slots([slot_id], now, end):
+                # A reservation for this window committed after the candidate was picked
+                db.session.rollback()
+                lost.add(slot_id)
+                continue
+
+            record_slots_taken([slot_zone_id])
+            booking = Booking(
+                user_id=user_id,
+                slot_id=slot_id,
+                vehicle_number=vehicle_number,
+                start_time=now,
+                end_time=end,
+                status='active'
+            )
+            db.session.add(booking)
+            record_booking(user_id)
+            db.session.commit()
+        except OperationalError:
+            # e.g. SQLite "database is locked"; nothing was committed
+            db.session.rollback()
+            _backoff(attempt)
+            continue
+
+        occupancy.mark_taken(slot_zone_id, slot_id)
+        reservations.add(slot_id, booking.id, now, end)
+        return booking
+
+    raise BookingContention()
+
+
+MAX_FLEET = 100
+FLEET_POLICIES = ('pack', 'spread')
+
+
+def _free_slots(zone_id, skip, start, end):
+    zone = occupancy.get(zone_id)
+    if zone is not None:
+        slot_ids = [slot_id for slot_id in zone.free_slot_ids() if slot_id not in skip]
+    else:
+        query = db.session.query(ParkingSlot.id).filter(
+            ParkingSlot.zone_id == zone_id, ParkingSlot.is_available.is_(True))
+        slot_ids = [slot_id for (slot_id,) in query if slot_id not in skip]
+    return reservations.free_slot_ids(slot_ids, start, end)
+
+
+def _plan_fleet(free_by_zone, count, policy):
+    """Pick ``count`` slot ids from ``free_by_zone`` (zone id -> free slot ids, in preference order).
+
+    ``pack`` keeps the fleet together: the first zone that fits everyone,
+    otherwise zones filled in order. ``spread`` deals vehicles round-robin
+    across every zone with room. Returns None if there are not enough slots.
+    """
+    if sum(len(slot_ids) for slot_ids in free_by_zone.values()) < count:
+        return None
+    if policy == 'pack':
+        for slot_ids in free_by_zone.values():
+            if len(slot_ids) >= count:
+                return slot_ids[:count]
+        picked = []
+        for slot_ids in free_by_zone.values():
+            picked.extend(slot_ids[:count - len(picked)])
+        return picked
+
+    taken = dict.fromkeys(free_by_zone, 0)
+    picked = []
+    while len(picked) < count:
+        for zone_id, slot_ids in free_by_zone.items():
+            if taken[zone_id] < len(slot_ids) and len(picked) < count:
+                picked.append(slot_ids[taken[zone_id]])
+                taken[zone_id] += 1
+    return picked
+
+
+def _claim_slots(slot_ids):
+    """Set-based compare-and-swap; returns ``{slot_id: (zone_id, slot_number)}`` for the slots this transaction won."""
+    rows = db.session.execute(
+        update(ParkingSlot)
+        .where(ParkingSlot.id.in_(slot_ids), ParkingSlot.is_available.is_(True))
+        .values(is_available=False)
+        .returning(ParkingSlot.id, ParkingSlot.zone_id, ParkingSlot.slot_number)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return {slot_id: (zone_id, slot_number) for slot_id, zone_id, slot_number in rows}
+
+
+def _claim_fleet(zone_ids, count, policy, start, end):
+    claimed = {}
+    tried = set()
+    for attempt in range(MAX_ATTEMPTS):
+        need = count - len(claimed)
+        if need == 0:
+            return claimed
+        free_by_zone = {zone_id: _free_slots(zone_id, tried, start, end) for zone_id in zone_ids}
+        picked = _plan_fleet({z: ids for z, ids in free_by_zone.items() if ids}, need, policy)
+        if picked is None:
+            raise NoSpotAvailable()
+        tried.update(picked)
+        won = _claim_slots(picked)
+        claimed.update(won)
+        for slot_id in set(picked) - won.keys():
+            # Someone else holds it; keep the index from offering it again
+            zone_id = next(z for z, ids in free_by_zone.items() if slot_id in ids)
+            occupancy.mark_taken(zone_id, slot_id)
+        if len(won) < len(picked):
+            _backoff(attempt)
+    if len(claimed) < count:
+        raise BookingContention()
+    return claimed
+
+
+def book_fleet(user_id, vehicle_numbers, duration=1, zone_ids=None, policy='pack'):
+    """Book one slot per vehicle in a single transaction, all or nothing.
+
+    ``zone_ids`` lists acceptable lots in order of preference; without it
+    every lot is considered, emptiest first. Slots are claimed with one
+    conditional UPDATE per attempt; slots lost to concurrent bookings are
+    replaced within the same transaction, and the claimed slots are
+    rechecked for reservations the same way as in ``book_spot``. Raises
+    ``NoSpotAvailable`` when
+    the lots cannot hold the whole fleet and ``BookingContention`` when the
+    retries ran out. Returns one dict per vehicle, in ``vehicle_numbers`` order.
+    """
+    if zone_ids is None:
+        zone_ids = [zone_id for zone_id, free, _ in sorted(occupancy.counts(), key=lambda c: -c[1]) if free]
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            now = datetime.utcnow()
+            end = now + timedelta(hours=duration)
+            claimed = _claim_fleet(zone_ids, len(vehicle_numbers), policy, now, end)
+            if booked_slots(claimed, now, end):
+                # Reserved for this window after planning; plan again from the updated index
+                db.session.rollback()
+                _backoff(attempt)
+                continue
+            record_slots_taken(zone_id for zone_id, _ in claimed.values())
+            bookings = [
+                Booking(user_id=user_id, slot_id=slot_id, vehicle_number=vehicle_number,
+                        start_time=now, end_time=end, status='active')
+                for vehicle_number, slot_id in zip(vehicle_numbers, sorted(claimed))
+            ]
+            db.session.add_all(bookings)
+            record_booking(user_id, len(bookings))
+            db.session.flush()
+            booked = [{
+                'booking_id': booking.id,
+                'vehicle_number': booking.vehicle_number,
+                'lot_id': claimed[booking.slot_id][0],
+                'slot_id': booking.slot_id,
+                'slot_number': claimed[booking.slot_id][1]
+            } for booking in bookings]
+            db.session.commit()
+        except (NoSpotAvailable, BookingContention):
+            db.session.rollback()
+            raise
+        except OperationalError:
+            db.session.rollback()
+            _backoff(attempt)
+            continue
+
+        for slot_id, (zone_id, _) in claimed.items():
+            occupancy.mark_taken(zone_id, slot_id)
+        for booking in booked:
+            reservations.add(booking['slot_id'], booking['booking_id'], now, end)
+        return booked
+
+    raise BookingContention()
@@ -0,0 +1,54 @@
+"""Denormalized price, pincode and capacity columns on ``ParkingZone``.
+
+Lot listings render from ``parking_zones`` alone. ``price`` and
+``pincode`` are set when a lot is created; ``capacity`` and
+``free_capacity`` follow the slots. The ``record_*`` helpers stage the
+free-capacity change in the caller's session, next to the slot UPDATE
+that caused it, so both commit or roll back together. ``backfill``
+recomputes every column from the slots table.
+"""
+from collections import Counter
+from sqlalchemy import select, update, func
+from models import db, ParkingZone, ParkingSlot
+from response_cache import record_listing_change
+
+
+def _adjust(zone_ids, sign):
+    # One UPDATE per zone however many of its slots changed
+    counts = Counter(zone_ids)
+    for zone_id, count in counts.items():
+        db.session.execute(
+            update(ParkingZone).where(ParkingZone.id == zone_id)
+            .values(free_capacity=ParkingZone.free_capacity + sign * count)
+            .execution_options(synchronize_session=False)
+        )
+    if counts:
+        record_listing_change()
+
+
+def record_slots_taken(zone_ids):
+    """Stage the capacity change for slots that were claimed; one zone id per slot."""
+    _adjust(zone_ids, -1)
+
+
+def record_slots_freed(zone_ids):
+    _adjust(zone_ids, 1)
+
+
+def backfill(conn):
+    """Recompute price, pincode, capacity and free_capacity of every zone; returns the zones updated."""
+    slots = ParkingSlot.__table__
+    zones = ParkingZone.__table__
+    in_zone = slots.c.zone_id == zones.c.id
+
+    def first_slot(column):
+        return select(column).where(in_zone).order_by(slots.c.id).limit(1).scalar_subquery()
+
+    result = conn.execute(zones.update().values(
+        price=first_slot(slots.c.price_per_hour),
+        pincode=first_slot(slots.c.pincode),
+        capacity=select(func.count(slots.c.id)).where(in_zone).scalar_subquery(),
+        free_capacity=select(func.count(slots.c.id)).where(in_zone, slots.c.is_available.is_(True))
+        .scalar_subquery(),
+    ))
+    return result.rowcount
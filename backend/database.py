@@ -0,0 +1,111 @@
+"""Database engine configuration from the environment.
+
+``DATABASE_URL`` selects the database; it defaults to the SQLite file in
+the instance folder, and a PostgreSQL URL (``postgresql://user:pw@host/db``,
+with a driver such as psycopg2 installed) works as is. Pool settings
+(``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT``,
+``DB_POOL_RECYCLE``) apply to either backend. On
+SQLite every new connection also gets ``SQLITE_JOURNAL_MODE`` (WAL by
+default, so readers never block the writer), ``SQLITE_SYNCHRONOUS`` and
+``SQLITE_BUSY_TIMEOUT_MS`` (how long a writer waits for the lock before
+failing with "database is locked").
+"""
+import os
+from sqlalchemy import event, Float
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from models import db
+
+DEFAULT_URI = 'sqlite:///my_database.db'
+SQLITE_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+}
+POOL_SETTINGS = {
+    'DB_POOL_SIZE': ('pool_size', int),
+    'DB_MAX_OVERFLOW': ('max_overflow', int),
+    'DB_POOL_TIMEOUT': ('pool_timeout', float),
+    'DB_POOL_RECYCLE': ('pool_recycle', int),
+}
+
+
+def database_uri(env=os.environ):
+    uri = env.get('DATABASE_URL', DEFAULT_URI)
+    # Hosting providers still hand out the scheme SQLAlchemy dropped in 1.4
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri, env=os.environ):
+    options = {}
+    for name, (option, convert) in POOL_SETTINGS.items():
+        if env.get(name):
+            options[option] = convert(env[name])
+    if not uri.startswith('sqlite'):
+        # Drop connections the server closed while they sat in the pool
+        options['pool_pre_ping'] = True
+    return options
+
+
+def init_database(app, env=os.environ):
+    uri = app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_uri(env))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri, env))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    for name, default in SQLITE_DEFAULTS.items():
+        app.config.setdefault(name, env.get(name, default))
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        pragmas = (
+            f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+            f"PRAGMA journal_mode = {app.config['SQLITE_JOURNAL_MODE'].upper()}",
+            f"PRAGMA synchronous = {app.config['SQLITE_SYNCHRONOUS'].upper()}",
+        )
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+    return engine
+
+
+def lock_for_write():
+    """Take the database write lock at the start of the session's transaction.
+
+    SQLite reads without any lock until the first INSERT or UPDATE, so a
+    check-then-insert can interleave with another writer. ``BEGIN
+    IMMEDIATE`` makes the check run under the write lock. Other backends
+    lock the rows involved instead (``with_for_update``); this is a no-op
+    there.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class elapsed_hours(FunctionElement):
+    """``elapsed_hours(start, end)``: hours from ``start`` to ``end``, never negative, in SQL.
+
+    Date arithmetic differs per backend (SQLite has no interval type and
+    no ``EXTRACT(EPOCH ...)``), so the expression is compiled per dialect.
+    """
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(elapsed_hours)
+def _elapsed_hours_default(element, compiler, **kw):
+    start, end = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f'GREATEST(EXTRACT(EPOCH FROM ({end} - {start})) / 3600.0, 0.0)'
+
+
+@compiles(elapsed_hours, 'sqlite')
+def _elapsed_hours_sqlite(element, compiler, **kw):
+    start, end = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f'MAX((julianday({end}) - julianday({start})) * 24.0, 0.0)'
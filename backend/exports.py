@@ -0,0 +1,79 @@
+import csv
+import io
+from models import db, User, ParkingSlot, Booking, Payment
+
+ROWS_PER_CHUNK = 500
+FETCH_SIZE = 1000
+
+USER_CSV_HEADER = ['Booking ID', 'Vehicle', 'Start Time', 'End Time', 'Status', 'Cost']
+ADMIN_CSV_HEADER = ['Booking ID', 'User ID', 'User Email', 'Vehicle', 'Slot Number', 'Location',
+                    'Start Time', 'End Time', 'Status', 'Cost', 'Payment ID', 'Amount', 'Method', 'Paid At']
+
+
+def _csv_chunks(header, rows):
+    # Rows are buffered ROWS_PER_CHUNK at a time, so memory stays flat however many rows there are
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def render_bill(payment):
+    return f"""
+    PARKING BILL
+    ============
+    Payment ID: {payment.id}
+    Date: {payment.paid_at.strftime('%Y-%m-%d %H:%M:%S')}
+    Customer: {payment.booking.user.fullname}
+    Vehicle: {payment.booking.vehicle_number}
+    Location: {payment.booking.slot.location}
+    Duration: {payment.booking.start_time.strftime('%H:%M')} - {payment.booking.end_time.strftime('%H:%M')}
+    Amount: ₹{payment.amount:.2f}
+    Method: {payment.method}
+    """
+
+
+def user_bookings_csv(user_id):
+    rows = db.session.query(
+        Booking.id, Booking.vehicle_number, Booking.start_time, Booking.end_time,
+        Booking.status, Booking.cost
+    ).filter(Booking.user_id == user_id) \
+        .order_by(Booking.id) \
+        .execution_options(stream_results=True, yield_per=FETCH_SIZE)
+    return _csv_chunks(USER_CSV_HEADER, rows)
+
+
+def admin_bookings_csv(start=None, end=None):
+    """All bookings with their payment (if any) that started in ``[start, end)``.
+
+    Bookings in deleted lots keep their rows and payments; their slot
+    columns are left empty.
+    """
+    query = db.session.query(
+        Booking.id, Booking.user_id, User.email, Booking.vehicle_number,
+        ParkingSlot.slot_number, ParkingSlot.location, Booking.start_time, Booking.end_time,
+        Booking.status, Booking.cost, Payment.id, Payment.amount, Payment.method, Payment.paid_at
+    ).join(User, Booking.user_id == User.id) \
+        .outerjoin(ParkingSlot, Booking.slot_id == ParkingSlot.id) \
+        .outerjoin(Payment, Payment.booking_id == Booking.id)
+    if start or end:
+        # Walk ix_bookings_start over the range, in its order, instead of sorting the matches
+        order = (Booking.start_time, Booking.id)
+    else:
+        order = (Booking.id,)
+    if start:
+        query = query.filter(Booking.start_time >= start)
+    if end:
+        query = query.filter(Booking.start_time < end)
+    rows = query.order_by(*order).execution_options(stream_results=True, yield_per=FETCH_SIZE)
+    return _csv_chunks(ADMIN_CSV_HEADER, rows)
@@ -0,0 +1,103 @@
+"""Server-sent events feed of per-zone availability changes.
+
+The occupancy index reports every change in a zone's free count here.
+Publishing appends one event to a shared, sequence-numbered ring buffer
+and wakes the waiting subscribers. There are no per-subscriber queues,
+so a booking writes one event however many clients are listening.
+Each subscriber remembers the last sequence number it sent and, when
+woken, sends only the newest counts of the zones that changed since.
+
+A subscriber blocks on a condition variable between events, so idle
+connections cost no CPU. Serve the app with a cooperative worker (e.g.
+``gunicorn -k gevent -w 1 app:app``) so that each open stream is a
+greenlet rather than an OS thread. One worker, because the occupancy
+index the feed is driven by lives in the web process.
+"""
+import json
+import threading
+import time
+from collections import deque
+from occupancy import occupancy
+
+BUFFER_SIZE = 4096  # events kept for reconnecting clients
+HEARTBEAT_SECONDS = 15
+STREAM_SECONDS = 300  # clients reconnect with Last-Event-ID after this
+RETRY_MS = 3000
+
+
+class AvailabilityFeed:
+    def __init__(self, maxlen=BUFFER_SIZE):
+        self._changed = threading.Condition()
+        self._events = deque(maxlen=maxlen)
+        self.seq = 0
+        self.subscribers = 0
+
+    def publish(self, zone_id, free, total):
+        with self._changed:
+            self.seq += 1
+            self._events.append((self.seq, zone_id, free, total))
+            self._changed.notify_all()
+
+    def changes_since(self, seq, timeout):
+        """Wait up to ``timeout`` for events after ``seq``.
+
+        Returns ``(last_seq, {zone_id: (free, total)})`` keeping only the
+        newest counts per zone, or ``(last_seq, None)`` when ``seq`` has
+        already left the buffer and the caller needs a full snapshot.
+        """
+        with self._changed:
+            if self.seq <= seq:
+                self._changed.wait(timeout)
+            if self.seq <= seq:
+                return seq, {}
+            if not self._events or self._events[0][0] > seq + 1:
+                return self.seq, None
+            zones = {}
+            for event_seq, zone_id, free, total in reversed(self._events):
+                if event_seq <= seq:
+                    break
+                zones.setdefault(zone_id, (free, total))
+            return self.seq, zones
+
+
+feed = AvailabilityFeed()
+occupancy.add_listener(feed.publish)
+
+
+def _message(event, seq, data):
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _snapshot(seq):
+    zones = [{'zone_id': zone_id, 'free': free, 'total': total}
+             for zone_id, free, total in occupancy.counts()]
+    return _message('snapshot', seq, zones)
+
+
+def stream(last_event_id=None):
+    """SSE generator: a snapshot (unless resuming), then availability changes."""
+    with feed._changed:
+        feed.subscribers += 1
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        seq = feed.seq
+        if last_event_id is None or last_event_id > seq:
+            yield _snapshot(seq)
+        else:
+            seq = last_event_id
+
+        deadline = time.monotonic() + STREAM_SECONDS
+        while time.monotonic() < deadline:
+            seq, zones = feed.changes_since(seq, HEARTBEAT_SECONDS)
+            if zones is None:
+                yield _snapshot(seq)
+            elif zones:
+                yield _message('availability', seq, [
+                    {'zone_id': zone_id, 'free': free, 'total': total}
+                    for zone_id, (free, total) in zones.items()
+                ])
+            else:
+                yield ': keep-alive\n\n'
+    finally:
+        with feed._changed:
+            feed.subscribers -= 1
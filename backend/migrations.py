@@ -0,0 +1,123 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in order, inside its own transaction and is
+recorded in ``schema_migrations``. Steps must be safe to run against a
+database that ``db.create_all()`` already brought up to date, because a
+fresh database gets the full current schema from migration 1.
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models import db, ParkingSlot, Booking, Payment
+from search_index import create_fts_tables
+from rollups import create_and_backfill as create_summary_rollups
+from pricing import reprice_bookings
+from capacity import backfill as backfill_zone_capacity
+from response_cache import create_and_seed as create_listing_version
+
+
+def _has_index(conn, table, name):
+    return any(index['name'] == name for index in inspect(conn).get_indexes(table))
+
+
+def _create_indexes(conn, *indexes):
+    for index in indexes:
+        if not _has_index(conn, index.table.name, index.name):
+            index.create(conn)
+
+
+def _has_column(conn, table, name):
+    return any(column['name'] == name for column in inspect(conn).get_columns(table))
+
+
+def _index(model, name):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+def initial_schema(conn):
+    db.metadata.create_all(conn)
+
+
+def hot_path_indexes(conn):
+    _create_indexes(
+        conn,
+        _index(ParkingSlot, 'ix_parking_slots_zone_available'),
+        _index(Booking, 'ix_bookings_user_start'),
+        _index(Booking, 'ix_bookings_status_end'),
+        _index(Payment, 'ix_payments_booking_id'),
+    )
+
+
+def slot_booking_index(conn):
+    _create_indexes(conn, _index(Booking, 'ix_bookings_slot_status'))
+
+
+def booking_start_index(conn):
+    _create_indexes(conn, _index(Booking, 'ix_bookings_start'))
+
+
+def stored_booking_cost(conn):
+    if not _has_column(conn, 'bookings', 'cost'):
+        conn.execute(text('ALTER TABLE bookings ADD COLUMN cost FLOAT'))
+    reprice_bookings(conn)
+
+
+def widen_password_columns(conn):
+    # Hashes are longer than the old VARCHAR(128); SQLite does not enforce lengths
+    if conn.dialect.name == 'sqlite':
+        return
+    for table in ('users', 'admins'):
+        conn.execute(text(f'ALTER TABLE {table} ALTER COLUMN password TYPE VARCHAR(255)'))
+
+
+def zone_capacity_columns(conn):
+    columns = (
+        ('price', 'FLOAT'),
+        ('pincode', 'VARCHAR(10)'),
+        ('capacity', 'INTEGER NOT NULL DEFAULT 0'),
+        ('free_capacity', 'INTEGER NOT NULL DEFAULT 0'),
+    )
+    for name, ddl in columns:
+        if not _has_column(conn, 'parking_zones', name):
+            conn.execute(text(f'ALTER TABLE parking_zones ADD COLUMN {name} {ddl}'))
+    backfill_zone_capacity(conn)
+
+
+MIGRATIONS = [
+    (1, 'initial schema', initial_schema),
+    (2, 'hot path indexes', hot_path_indexes),
+    (3, 'full-text search tables', create_fts_tables),
+    (4, 'summary rollups', create_summary_rollups),
+    (5, 'booking slot index', slot_booking_index),
+    (6, 'stored booking cost', stored_booking_cost),
+    (7, 'password hash columns', widen_password_columns),
+    (8, 'zone capacity columns', zone_capacity_columns),
+    (9, 'listing version counter', create_listing_version),
+    (10, 'booking start index', booking_start_index),
+]
+
+
+def current_version(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+    return conn.execute(text('SELECT MAX(version) FROM schema_migrations')).scalar() or 0
+
+
+def upgrade():
+    """Apply every pending migration and return the list of versions applied."""
+    applied = []
+    with db.engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, name, step in MIGRATIONS:
+        if number <= version:
+            continue
+        with db.engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)'),
+                {'v': number, 'n': name, 't': datetime.utcnow()}
+            )
+        applied.append(number)
+    return applied
@@ -7,7 +7,7 @@ class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    password = db.Column(db.String(255), nullable=False)  # werkzeug scrypt hash
     fullname = db.Column(db.String(100), nullable=False)
     address = db.Column(db.String(255), nullable=True)
     pincode = db.Column(db.String(10), nullable=True)
@@ -17,7 +17,7 @@ class Admin(db.Model):
     __tablename__ = 'admins'
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    password = db.Column(db.String(255), nullable=False)  # werkzeug scrypt hash
     fullname = db.Column(db.String(100), nullable=False)
     address = db.Column(db.String(255), nullable=True)
     pincode = db.Column(db.String(10), nullable=True)
@@ -28,6 +28,11 @@ class ParkingZone(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     city = db.Column(db.String(100), nullable=False)
+    # Denormalized from the slots so listings need only this table; see capacity.py
+    price = db.Column(db.Float, nullable=True)
+    pincode = db.Column(db.String(10), nullable=True)
+    capacity = db.Column(db.Integer, default=0, nullable=False)
+    free_capacity = db.Column(db.Integer, default=0, nullable=False)
     slots = db.relationship('ParkingSlot', backref='zone', lazy=True)
 
 class ParkingSlot(db.Model):
@@ -41,6 +46,10 @@ class ParkingSlot(db.Model):
     zone_id = db.Column(db.Integer, db.ForeignKey('parking_zones.id'), nullable=True)
     bookings = db.relationship('Booking', backref='slot', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_parking_slots_zone_available', 'zone_id', 'is_available'),
+    )
+
 class Booking(db.Model):
     __tablename__ = 'bookings'
     id = db.Column(db.Integer, primary_key=True)
@@ -49,10 +58,18 @@ class Booking(db.Model):
     vehicle_number = db.Column(db.String(50), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.String(20), default='active')  # active, completed, cancelled
+    status = db.Column(db.String(20), default='active')  # reserved, active, completed, cancelled
+    cost = db.Column(db.Float, nullable=True)  # set when the booking is released
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     payment = db.relationship('Payment', backref='booking', uselist=False)
 
+    __table_args__ = (
+        db.Index('ix_bookings_user_start', 'user_id', 'start_time'),
+        db.Index('ix_bookings_status_end', 'status', 'end_time'),
+        db.Index('ix_bookings_slot_status', 'slot_id', 'status'),
+        db.Index('ix_bookings_start', 'start_time'),
+    )
+
     @property
     def action(self):
         return 'Released' if self.status == 'completed' else 'Parked'
@@ -60,7 +77,23 @@ class Booking(db.Model):
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
-    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
     paid_at = db.Column(db.DateTime, default=datetime.utcnow)
-    method = db.Column(db.String(50), nullable=False)  # e.g., UPI, card, etc. 
\ No newline at end of file
+    method = db.Column(db.String(50), nullable=False)  # e.g., UPI, card, etc. 
+
+class SummaryRollup(db.Model):
+    __tablename__ = 'summary_rollups'
+    # One row per user plus the global row (user_id = 0)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    users = db.Column(db.Integer, default=0, nullable=False)
+    bookings = db.Column(db.Integer, default=0, nullable=False)
+    payments = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    parked_hours = db.Column(db.Float, default=0.0, nullable=False)
+
+class ListingVersion(db.Model):
+    __tablename__ = 'listing_version'
+    # A single row, bumped by every change the lot listings show; see response_cache.py
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,187 @@
+import bisect
+import threading
+from models import db, ParkingSlot, ParkingZone
+
+
+class ZoneOccupancy:
+    """Free/total counters and a free-slot bitmap for one parking zone.
+
+    Bit ``i`` of ``bitmap`` is set when the i-th slot of the zone (ordered by
+    slot id) is free, so claiming or releasing a slot only flips one bit.
+    """
+    __slots__ = ('zone_id', 'slot_ids', 'positions', 'bitmap', 'free', 'pincode', 'price')
+
+    def __init__(self, zone_id, pincode=None, price=None):
+        self.zone_id = zone_id
+        self.slot_ids = []
+        self.positions = {}
+        self.bitmap = bytearray()
+        self.free = 0
+        self.pincode = pincode
+        self.price = price
+
+    @property
+    def total(self):
+        return len(self.slot_ids)
+
+    def add_slot(self, slot_id, is_available):
+        pos = len(self.slot_ids)
+        self.slot_ids.append(slot_id)
+        self.positions[slot_id] = pos
+        if pos % 8 == 0:
+            self.bitmap.append(0)
+        if is_available:
+            self.bitmap[pos >> 3] |= 1 << (pos & 7)
+            self.free += 1
+
+    def set_available(self, slot_id, is_available):
+        pos = self.positions.get(slot_id)
+        if pos is None:
+            return False
+        mask = 1 << (pos & 7)
+        was_free = bool(self.bitmap[pos >> 3] & mask)
+        if was_free == is_available:
+            return False
+        if is_available:
+            self.bitmap[pos >> 3] |= mask
+            self.free += 1
+        else:
+            self.bitmap[pos >> 3] &= ~mask
+            self.free -= 1
+        return True
+
+    def is_free(self, slot_id):
+        pos = self.positions.get(slot_id)
+        return pos is not None and bool(self.bitmap[pos >> 3] & (1 << (pos & 7)))
+
+    def free_slot_ids(self):
+        for byte_index, byte in enumerate(self.bitmap):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield self.slot_ids[(byte_index << 3) + bit]
+
+
+class OccupancyIndex:
+    """In-process view of slot availability for every parking zone.
+
+    Built once from ``ParkingSlot.is_available`` and kept current by the
+    booking, release and lot CRUD endpoints, so lot listings can be served
+    without running a slot query per zone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._zones = {}
+        # Sorted (pincode, zone_id) pairs; a prefix maps to one contiguous range
+        self._pincodes = []
+        # Called with (zone_id, free, total) after a zone's availability changes
+        self._listeners = []
+        # Called with (zone_id, slot_id, is_available) after a single slot flips
+        self._slot_listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def add_slot_listener(self, listener):
+        self._slot_listeners.append(listener)
+
+    def _notify(self, zone_id, free, total):
+        for listener in self._listeners:
+            listener(zone_id, free, total)
+
+    def rebuild(self):
+        zones = {zone_id: ZoneOccupancy(zone_id) for (zone_id,) in db.session.query(ParkingZone.id)}
+        rows = db.session.query(
+            ParkingSlot.id, ParkingSlot.zone_id, ParkingSlot.is_available,
+            ParkingSlot.pincode, ParkingSlot.price_per_hour
+        ).filter(ParkingSlot.zone_id.isnot(None)).order_by(ParkingSlot.zone_id, ParkingSlot.id)
+
+        for slot_id, zone_id, is_available, pincode, price in rows:
+            zone = zones.get(zone_id)
+            if zone is None:
+                zone = zones[zone_id] = ZoneOccupancy(zone_id)
+            if zone.pincode is None:
+                zone.pincode, zone.price = pincode, price
+            zone.add_slot(slot_id, is_available)
+
+        pincodes = sorted((zone.pincode, zone.zone_id) for zone in zones.values() if zone.pincode)
+        with self._lock:
+            self._zones = zones
+            self._pincodes = pincodes
+
+    def add_zone(self, zone_id, slot_ids, pincode, price):
+        zone = ZoneOccupancy(zone_id, pincode, price)
+        for slot_id in sorted(slot_ids):
+            zone.add_slot(slot_id, True)
+        with self._lock:
+            old = self._zones.get(zone_id)
+            if old is not None and old.pincode:
+                self._remove_pincode(old.pincode, zone_id)
+            self._zones[zone_id] = zone
+            if pincode:
+                bisect.insort(self._pincodes, (pincode, zone_id))
+        self._notify(zone_id, zone.free, zone.total)
+
+    def drop_zone(self, zone_id):
+        with self._lock:
+            zone = self._zones.pop(zone_id, None)
+            if zone is not None and zone.pincode:
+                self._remove_pincode(zone.pincode, zone_id)
+        if zone is not None:
+            self._notify(zone_id, 0, 0)
+
+    def _remove_pincode(self, pincode, zone_id):
+        i = bisect.bisect_left(self._pincodes, (pincode, zone_id))
+        if i < len(self._pincodes) and self._pincodes[i] == (pincode, zone_id):
+            del self._pincodes[i]
+
+    def zones_by_pincode(self, prefix):
+        """Zones whose pincode starts with ``prefix`` and have a free slot, most free first.
+
+        Two binary searches bound the matching range of the sorted pincode
+        list, so an exact pincode or a short postal prefix costs O(log n)
+        plus the number of matches.
+        """
+        with self._lock:
+            lo = bisect.bisect_left(self._pincodes, (prefix,))
+            hi = bisect.bisect_left(self._pincodes, (prefix + '\uffff',))
+            matches = [self._zones[zone_id] for _, zone_id in self._pincodes[lo:hi]]
+        return sorted((zone for zone in matches if zone.free), key=lambda zone: -zone.free)
+
+    def mark_taken(self, zone_id, slot_id):
+        return self._set_available(zone_id, slot_id, False)
+
+    def mark_free(self, zone_id, slot_id):
+        return self._set_available(zone_id, slot_id, True)
+
+    def _set_available(self, zone_id, slot_id, is_available):
+        with self._lock:
+            zone = self._zones.get(zone_id)
+            changed = zone.set_available(slot_id, is_available) if zone else False
+            counts = (zone.free, zone.total) if changed else None
+        if changed:
+            for listener in self._slot_listeners:
+                listener(zone_id, slot_id, is_available)
+            self._notify(zone_id, *counts)
+        return changed
+
+    def get(self, zone_id):
+        return self._zones.get(zone_id)
+
+    def free_count(self, zone_id):
+        zone = self._zones.get(zone_id)
+        return zone.free if zone else 0
+
+    def total_count(self, zone_id):
+        zone = self._zones.get(zone_id)
+        return zone.total if zone else 0
+
+    def counts(self):
+        """``(zone_id, free, total)`` for every zone."""
+        with self._lock:
+            return [(zone.zone_id, zone.free, zone.total) for zone in self._zones.values()]
+
+
+occupancy = OccupancyIndex()
@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise CursorError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise CursorError('Invalid cursor')
+
+    decoded = []
+    for column, value in zip(columns, values):
+        if column.type.python_type is datetime:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise CursorError('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def parse_limit(value):
+    if value in (None, ''):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise CursorError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def keyset_page(query, columns, limit, after=None, descending=False):
+    """Return ``(items, next_cursor)`` for one page of ``query``.
+
+    ``columns`` must form a unique sort key (end with the primary key). The
+    page starts strictly after the row encoded in ``after``, so the database
+    seeks through the index instead of skipping an OFFSET, and deep pages
+    cost the same as the first one.
+    """
+    key = tuple_(*columns) if len(columns) > 1 else columns[0]
+    if after:
+        values = decode_cursor(after, columns)
+        bound = tuple_(*values) if len(columns) > 1 else values[0]
+        query = query.filter(key < bound if descending else key > bound)
+
+    order = [c.desc() if descending else c.asc() for c in columns]
+    items = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+    return items, next_cursor
@@ -0,0 +1,107 @@
+"""Password hashing on a bounded worker pool.
+
+Hashes are werkzeug's scrypt format (``scrypt:N:r:p$salt$hash``); the
+KDF releases the GIL, so a small thread pool runs it in parallel while
+capping how many hashes (each needing ``128 * N * r`` bytes of memory)
+are in flight at once. When more than ``PASSWORD_HASH_QUEUE`` requests
+are already waiting, new ones fail fast with ``HasherBusy`` instead of
+piling up behind the rush.
+
+Under a gevent worker (see live_feed.py) patched threads are greenlets,
+so a KDF run would hold the worker's only OS thread and stall every
+request and SSE stream for its duration. When ``threading`` is patched
+the pool is gevent's ``ThreadPoolExecutor`` instead, which runs on
+native threads while the waiting greenlet yields to the hub.
+
+``PASSWORD_HASH_COST`` is log2 of scrypt's N. Rows still holding a
+plaintext password, or a hash made with a different cost, are reported
+by ``verify_password`` as needing a rehash, and the login routes store a
+fresh hash after the next successful login.
+"""
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_COST = 15  # scrypt N = 32768
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_QUEUE = 64
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _native_pool(workers):
+    try:
+        from gevent import monkey
+    except ImportError:
+        monkey = None
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+
+class PasswordHasher:
+    def __init__(self, cost=DEFAULT_COST, workers=DEFAULT_WORKERS, queue=DEFAULT_QUEUE):
+        self.method = f'scrypt:{2 ** cost}:8:1'
+        self._pool = _native_pool(workers)
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        # Compared against when the account does not exist, so both paths cost one KDF run
+        self._dummy = generate_password_hash('', method=self.method)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        """Check ``password`` against a stored hash or legacy plaintext value.
+
+        Returns ``(matches, needs_rehash)``. ``stored`` may be None for an
+        unknown account; the check still takes as long as a real one.
+        """
+        if stored is None:
+            self._run(check_password_hash, self._dummy, password)
+            return False, False
+        if not stored.startswith(HASH_PREFIXES):
+            return hmac.compare_digest(stored.encode(), password.encode()), True
+        matches = self._run(check_password_hash, stored, password)
+        return matches, matches and not stored.startswith(self.method + '$')
+
+
+_hasher = None
+
+
+def init_passwords(app):
+    global _hasher
+    app.config.setdefault('PASSWORD_HASH_COST', DEFAULT_COST)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+    app.config.setdefault('PASSWORD_HASH_QUEUE', DEFAULT_QUEUE)
+    _hasher = PasswordHasher(app.config['PASSWORD_HASH_COST'], app.config['PASSWORD_HASH_WORKERS'],
+                             app.config['PASSWORD_HASH_QUEUE'])
+    return _hasher
+
+
+def _get_hasher():
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher()
+    return _hasher
+
+
+def hash_password(password):
+    return _get_hasher().hash(password)
+
+
+def verify_password(stored, password):
+    return _get_hasher().verify(stored, password)
@@ -0,0 +1,177 @@
+"""Per-endpoint request latency and SQL statement metrics.
+
+A sampled request gets a small counter object in a context variable; the
+engine's cursor events add to it, so statement counts and time belong to
+the request that ran them even with many threads. Unsampled requests,
+background threads and Celery tasks see no counter and the event hooks
+return immediately. With ``PROFILE_SAMPLE_RATE=0`` the hooks are not
+installed at all.
+
+Latency is measured up to the point the response is handed to the WSGI
+server, so streamed bodies (CSV exports, the live feed) count their time
+to first byte.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from models import db
+from app_logging import get_logger
+
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_QUERY_BUDGET = 20
+# Prometheus histogram bucket bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_sql', default=None)
+log = get_logger('profiling')
+
+
+class SqlCounter:
+    __slots__ = ('statements', 'seconds', '_started')
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self._started = 0.0
+
+
+class EndpointStats:
+    __slots__ = ('requests', 'latency_buckets', 'latency_sum', 'query_buckets',
+                 'statements', 'sql_seconds', 'over_budget')
+
+    def __init__(self):
+        self.requests = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.query_buckets = [0] * (len(QUERY_BUCKETS) + 1)
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.over_budget = 0
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, endpoint, method, status, seconds, sql, over_budget):
+        key = (endpoint, method, status)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats()
+            stats.requests += 1
+            stats.latency_buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.latency_sum += seconds
+            stats.query_buckets[bisect_left(QUERY_BUCKETS, sql.statements)] += 1
+            stats.statements += sql.statements
+            stats.sql_seconds += sql.seconds
+            stats.over_budget += over_budget
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            snapshot = [(key, _copy(stats)) for key, stats in items]
+
+        lines = []
+        _histogram(lines, 'http_request_duration_seconds', 'Request latency up to the first response byte.',
+                   LATENCY_BUCKETS, snapshot, 'latency_buckets', 'latency_sum')
+        _histogram(lines, 'http_request_sql_statements', 'SQL statements executed per request.',
+                   QUERY_BUCKETS, snapshot, 'query_buckets', 'statements')
+        _counter(lines, 'http_request_sql_seconds_total', 'Time spent executing SQL, per endpoint.',
+                 snapshot, 'sql_seconds')
+        _counter(lines, 'http_request_query_budget_exceeded_total',
+                 'Requests that executed more SQL statements than the query budget.', snapshot, 'over_budget')
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(stats):
+    copy = EndpointStats()
+    for name in EndpointStats.__slots__:
+        value = getattr(stats, name)
+        setattr(copy, name, list(value) if isinstance(value, list) else value)
+    return copy
+
+
+def _labels(key, **extra):
+    endpoint, method, status = key
+    pairs = [('endpoint', endpoint), ('method', method), ('status', str(status))] + list(extra.items())
+    return ','.join(f'{name}="{value}"' for name, value in pairs)
+
+
+def _histogram(lines, name, help_text, bounds, snapshot, buckets_attr, sum_attr):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, stats in snapshot:
+        cumulative = 0
+        for bound, count in zip(bounds + ('+Inf',), getattr(stats, buckets_attr)):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{_labels(key, le=bound)}}} {cumulative}')
+        lines.append(f'{name}_sum{{{_labels(key)}}} {getattr(stats, sum_attr)}')
+        lines.append(f'{name}_count{{{_labels(key)}}} {stats.requests}')
+
+
+def _counter(lines, name, help_text, snapshot, attr):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} counter')
+    for key, stats in snapshot:
+        lines.append(f'{name}{{{_labels(key)}}} {getattr(stats, attr)}')
+
+
+metrics = RequestMetrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sql = _current.get()
+    if sql is not None:
+        sql._started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sql = _current.get()
+    if sql is not None:
+        sql.statements += 1
+        sql.seconds += time.perf_counter() - sql._started
+
+
+def init_profiling(app):
+    app.config.setdefault('PROFILE_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+    app.config.setdefault('QUERY_BUDGET', DEFAULT_QUERY_BUDGET)
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    budget = app.config['QUERY_BUDGET']
+    if rate <= 0:
+        return
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profiling():
+        if rate < 1 and random.random() >= rate:
+            return
+        g.profile_started = time.perf_counter()
+        g.profile_token = _current.set(SqlCounter())
+
+    @app.after_request
+    def finish_profiling(response):
+        started = g.pop('profile_started', None)
+        if started is None:
+            return response
+        sql = _current.get()
+        _current.reset(g.pop('profile_token'))
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        over_budget = sql.statements > budget
+        metrics.record(endpoint, request.method, response.status_code,
+                       time.perf_counter() - started, sql, over_budget)
+        response.headers['X-Query-Count'] = str(sql.statements)
+        if over_budget:
+            log.warning("Query budget exceeded: %s %s ran %d statements (%.1fms in SQL)",
+                        request.method, endpoint, sql.statements, sql.seconds * 1000)
+        return response
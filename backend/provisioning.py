@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import time
+from models import db, ParkingSlot, ParkingZone
+from occupancy import occupancy
+from response_cache import record_listing_change
+
+SLOT_INSERT_CHUNK = 1000
+LOTS_PER_TRANSACTION = 50
+LOT_FIELDS = ('name', 'address', 'pincode', 'price', 'spots')
+
+
+class LotRowError(ValueError):
+    pass
+
+
+def _insert_slots(zone_id, name, address, pincode, price, spots):
+    # Multi-row INSERTs in fixed-size chunks instead of one ORM object per slot
+    table = ParkingSlot.__table__
+    for offset in range(0, spots, SLOT_INSERT_CHUNK):
+        rows = [{
+            'location': address,
+            'slot_number': f"{name}-{i + 1}",
+            'is_available': True,
+            'price_per_hour': price,
+            'pincode': pincode,
+            'zone_id': zone_id
+        } for i in range(offset, min(spots, offset + SLOT_INSERT_CHUNK))]
+        db.session.execute(table.insert(), rows)
+
+
+def add_lot(name, address, pincode, price, spots):
+    """Stage a parking zone and all of its slots in the current transaction.
+
+    Returns the new zone id. The caller commits and then calls
+    ``publish_lots`` so the occupancy index picks the lot up.
+    """
+    zone = ParkingZone(name=name, city=address, price=float(price), pincode=pincode,
+                       capacity=int(spots), free_capacity=int(spots))
+    db.session.add(zone)
+    db.session.flush()
+    _insert_slots(zone.id, name, address, pincode, float(price), int(spots))
+    record_listing_change()
+    return zone.id
+
+
+def publish_lots(zone_ids):
+    if not zone_ids:
+        return
+    rows = db.session.query(
+        ParkingSlot.zone_id, ParkingSlot.id, ParkingSlot.pincode, ParkingSlot.price_per_hour
+    ).filter(ParkingSlot.zone_id.in_(zone_ids)).order_by(ParkingSlot.zone_id, ParkingSlot.id)
+
+    lots = {zone_id: ([], None, None) for zone_id in zone_ids}
+    for zone_id, slot_id, pincode, price in rows:
+        slot_ids, _, _ = lots[zone_id]
+        slot_ids.append(slot_id)
+        lots[zone_id] = (slot_ids, pincode, price)
+    for zone_id, (slot_ids, pincode, price) in lots.items():
+        occupancy.add_zone(zone_id, slot_ids, pincode, price)
+
+
+def validate_lot_row(row):
+    if not isinstance(row, dict):
+        raise LotRowError('Each lot must be an object')
+    missing = [field for field in LOT_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise LotRowError(f'Missing required fields: {", ".join(missing)}')
+    try:
+        price = float(row['price'])
+        spots = int(row['spots'])
+    except (TypeError, ValueError):
+        raise LotRowError('price must be a number and spots an integer')
+    if price < 0 or spots <= 0:
+        raise LotRowError('price must be >= 0 and spots > 0')
+    return str(row['name']), str(row['address']), str(row['pincode']), price, spots
+
+
+def iter_lot_rows(stream, fmt):
+    """Yield lot dicts from a binary stream.
+
+    ``csv`` and ``jsonl`` are read line by line; ``json`` expects a top-level
+    array and is parsed in one go. A JSON Lines line that does not parse is
+    yielded as a ``LotRowError`` so the import reports it and carries on.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(text)
+    elif fmt == 'jsonl':
+        for line in text:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield LotRowError(f'Invalid JSON: {e}')
+    elif fmt == 'json':
+        rows = json.load(text)
+        if not isinstance(rows, list):
+            raise LotRowError('JSON import must be an array of lots')
+        yield from rows
+    else:
+        raise LotRowError(f'Unsupported import format: {fmt}')
+
+
+def import_lots(rows, lots_per_transaction=LOTS_PER_TRANSACTION):
+    """Insert lots from an iterable of dicts in chunked transactions.
+
+    Invalid rows are skipped and reported; a failed chunk is rolled back
+    on its own without undoing chunks that were already committed. If
+    ``rows`` itself fails (unreadable CSV, malformed JSON array) the rows
+    validated so far are still imported and the failure is reported as
+    an error on the row where reading stopped.
+    """
+    started = time.perf_counter()
+    stats = {'lots': 0, 'slots': 0, 'errors': []}
+    pending = []
+
+    def flush():
+        try:
+            zone_ids = [add_lot(*lot) for _, lot in pending]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            first_row = pending[0][0]
+            stats['errors'].append({'row': first_row, 'error': f'Chunk starting at row {first_row} failed: {e}'})
+        else:
+            publish_lots(zone_ids)
+            stats['lots'] += len(pending)
+            stats['slots'] += sum(lot[4] for _, lot in pending)
+        pending.clear()
+
+    rows = iter(rows)
+    row_number = 0
+    while True:
+        row_number += 1
+        try:
+            row = next(rows)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error) as e:
+            stats['errors'].append({'row': row_number, 'error': f'Import stopped: {e}'})
+            break
+        try:
+            if isinstance(row, LotRowError):
+                raise row
+            pending.append((row_number, validate_lot_row(row)))
+        except LotRowError as e:
+            stats['errors'].append({'row': row_number, 'error': str(e)})
+            continue
+        if len(pending) >= lots_per_transaction:
+            flush()
+    if pending:
+        flush()
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_sec'] = round((stats['lots'] + stats['slots']) / elapsed, 1) if elapsed else 0.0
+    return stats
@@ -0,0 +1,97 @@
+"""Rendering and caching of payment QR codes.
+
+Rendering is CPU bound (QR encoding plus PNG compression), so it runs in
+a small process pool instead of on the request thread, and finished
+images are kept in a bounded LRU keyed by the UPI payload. Workers are
+spawned rather than forked: by the time the first QR is rendered the web
+process already runs the log listener, password hash pool and sweeper
+threads, and forking a multi-threaded process can deadlock the child.
+"""
+import io
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+CACHE_SIZE = 512
+RENDER_WORKERS = 2
+RENDER_TIMEOUT = 10  # seconds
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def render_qr(data, fmt='png'):
+    """Return the encoded image bytes for ``data``. Runs in a worker process."""
+    import qrcode
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        import qrcode.image.svg
+        qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qrcode.make(data).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        self._keys_by_booking = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, booking_id, key, image):
+        with self._lock:
+            self._images[key] = (booking_id, image)
+            self._images.move_to_end(key)
+            self._keys_by_booking.setdefault(booking_id, set()).add(key)
+            while len(self._images) > self.maxsize:
+                old_key, (old_booking_id, _) = self._images.popitem(last=False)
+                keys = self._keys_by_booking.get(old_booking_id)
+                if keys is not None:
+                    keys.discard(old_key)
+                    if not keys:
+                        del self._keys_by_booking[old_booking_id]
+
+    def evict_booking(self, booking_id):
+        with self._lock:
+            for key in self._keys_by_booking.pop(booking_id, ()):
+                self._images.pop(key, None)
+
+
+qr_cache = QRCache()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def payment_qr(booking_id, upi_string, fmt='png'):
+    """Cached QR image bytes for a booking's UPI payment string."""
+    key = (upi_string, fmt)
+    image = qr_cache.get(key)
+    if image is None:
+        image = _executor().submit(render_qr, upi_string, fmt).result(timeout=RENDER_TIMEOUT)
+        qr_cache.put(booking_id, key, image)
+    return image
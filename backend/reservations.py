@@ -0,0 +1,249 @@
+"""Advance reservations and the per-slot schedule behind them.
+
+A reservation is a booking with status ``reserved`` for a future
+``[start_time, end_time)`` window; the slot stays available until the
+window starts, when ``activate_due`` (run by the sweeper) claims the slot
+and turns the reservation into an ordinary active booking.
+
+``ReservationIndex`` keeps, per slot, the windows of its reserved and
+active bookings as two parallel sorted arrays. Windows on one slot never
+overlap, so the end times are sorted too and "is ``[t1, t2)`` free" is a
+single binary search: find the first window ending after ``t1`` and check
+whether it starts before ``t2``. Lookups for a whole zone therefore cost
+O(slots * log windows) and never read the bookings table.
+"""
+import bisect
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from models import db, Booking, ParkingSlot
+from occupancy import occupancy
+from rollups import record_booking
+from capacity import record_slots_taken
+from database import lock_for_write
+from app_logging import get_logger
+
+# Bookings that hold a slot for their window
+HOLDING_STATUSES = ('reserved', 'active')
+MAX_RESERVATION_HOURS = 24
+MAX_ADVANCE_DAYS = 30
+
+log = get_logger('reservations')
+
+
+class SlotTaken(Exception):
+    pass
+
+
+class SlotSchedule:
+    """Sorted, non-overlapping booking windows for one slot."""
+    __slots__ = ('starts', 'ends', 'booking_ids')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.booking_ids = []
+
+    def is_free(self, start, end):
+        i = bisect.bisect_right(self.ends, start)
+        return i == len(self.starts) or self.starts[i] >= end
+
+    def add(self, booking_id, start, end):
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.booking_ids.insert(i, booking_id)
+
+    def remove(self, booking_id):
+        i = self.booking_ids.index(booking_id)
+        del self.starts[i], self.ends[i], self.booking_ids[i]
+        return not self.booking_ids
+
+
+class ReservationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+        # booking id -> slot id, so releases and cancellations need only the booking
+        self._bookings = {}
+
+    def rebuild(self):
+        rows = db.session.execute(
+            select(Booking.id, Booking.slot_id, Booking.start_time, Booking.end_time)
+            .where(Booking.status.in_(HOLDING_STATUSES))
+            .order_by(Booking.slot_id, Booking.start_time)
+        )
+        slots, bookings = {}, {}
+        for booking_id, slot_id, start, end in rows:
+            schedule = slots.get(slot_id)
+            if schedule is None:
+                schedule = slots[slot_id] = SlotSchedule()
+            schedule.starts.append(start)
+            schedule.ends.append(end)
+            schedule.booking_ids.append(booking_id)
+            bookings[booking_id] = slot_id
+        with self._lock:
+            self._slots = slots
+            self._bookings = bookings
+
+    def add(self, slot_id, booking_id, start, end):
+        with self._lock:
+            schedule = self._slots.get(slot_id)
+            if schedule is None:
+                schedule = self._slots[slot_id] = SlotSchedule()
+            schedule.add(booking_id, start, end)
+            self._bookings[booking_id] = slot_id
+
+    def remove(self, booking_id):
+        with self._lock:
+            slot_id = self._bookings.pop(booking_id, None)
+            if slot_id is not None and self._slots[slot_id].remove(booking_id):
+                del self._slots[slot_id]
+
+    def is_free(self, slot_id, start, end):
+        with self._lock:
+            schedule = self._slots.get(slot_id)
+            return schedule is None or schedule.is_free(start, end)
+
+    def free_slot_ids(self, slot_ids, start, end):
+        """The subset of ``slot_ids`` with nothing booked in ``[start, end)``, in order."""
+        with self._lock:
+            return [slot_id for slot_id in slot_ids
+                    if slot_id not in self._slots or self._slots[slot_id].is_free(start, end)]
+
+
+reservations = ReservationIndex()
+
+
+def validate_window(start, end, now=None):
+    """Error message for an unacceptable reservation window, or None."""
+    now = now or datetime.utcnow()
+    if end <= start:
+        return 'end must be after start'
+    if start < now:
+        return 'start must be in the future'
+    if end - start > timedelta(hours=MAX_RESERVATION_HOURS):
+        return f'Reservations are limited to {MAX_RESERVATION_HOURS} hours'
+    if start - now > timedelta(days=MAX_ADVANCE_DAYS):
+        return f'Reservations open {MAX_ADVANCE_DAYS} days in advance'
+    return None
+
+
+def free_slots(zone_id, start, end, now=None):
+    """Slot ids in ``zone_id`` with nothing booked in ``[start, end)``.
+
+    A window that has already begun also needs the slot to be empty right
+    now, which covers cars parked past their planned end.
+    """
+    zone = occupancy.get(zone_id)
+    if zone is None:
+        return []
+    if start <= (now or datetime.utcnow()):
+        candidates = list(zone.free_slot_ids())
+    else:
+        candidates = zone.slot_ids
+    return reservations.free_slot_ids(candidates, start, end)
+
+
+def booked_slots(slot_ids, start, end):
+    """The subset of ``slot_ids`` that a reserved or active booking holds during ``[start, end)``.
+
+    Read from the bookings table, not the index, so it sees windows other
+    processes committed. Callers run it while holding the slots' write
+    lock.
+    """
+    return set(db.session.scalars(
+        select(Booking.slot_id).where(
+            Booking.slot_id.in_(slot_ids), Booking.status.in_(HOLDING_STATUSES),
+            Booking.start_time < end, Booking.end_time > start
+        )
+    ))
+
+
+def reserve(user_id, zone_id, vehicle_number, start, end, slot_id=None):
+    """Reserve a slot in ``zone_id`` for ``[start, end)``.
+
+    Candidates come from the in-memory schedule. Before the reservation is
+    written, the window is rechecked against the bookings table under a
+    write lock: the whole database on SQLite (``BEGIN IMMEDIATE``), the
+    slot's row elsewhere. Immediate bookings recheck the same way after
+    claiming their slot (see booking_engine.py), so neither path can sell
+    a window the other just took, even from another process.
+    Raises ``SlotTaken`` when no slot (or the requested ``slot_id``) is free.
+    """
+    candidates = [slot_id] if slot_id is not None else free_slots(zone_id, start, end)
+    for candidate in candidates:
+        lock_for_write()
+        slot = db.session.execute(
+            select(ParkingSlot.id).where(ParkingSlot.id == candidate, ParkingSlot.zone_id == zone_id)
+            .with_for_update()
+        ).first()
+        if slot is None or booked_slots([candidate], start, end):
+            db.session.rollback()
+            continue
+        booking = Booking(user_id=user_id, slot_id=candidate, vehicle_number=vehicle_number,
+                          start_time=start, end_time=end, status='reserved')
+        db.session.add(booking)
+        record_booking(user_id)
+        db.session.commit()
+        reservations.add(candidate, booking.id, start, end)
+        return booking
+    raise SlotTaken()
+
+
+def cancel(booking):
+    booking.status = 'cancelled'
+    db.session.commit()
+    reservations.remove(booking.id)
+
+
+def activate_due(now=None):
+    """Start reservations whose window has begun; returns how many were activated.
+
+    Each due reservation claims its slot with the same compare-and-swap
+    as an immediate booking. A slot still occupied (a car parked past its
+    end) is retried on the next pass; reservations whose window ended
+    without the slot ever coming free are cancelled.
+    """
+    now = now or datetime.utcnow()
+    due = db.session.execute(
+        select(Booking.id, Booking.slot_id, Booking.end_time)
+        .where(Booking.status == 'reserved', Booking.start_time <= now)
+        .order_by(Booking.start_time)
+    ).all()
+    if not due:
+        return 0
+
+    missed = [row.id for row in due if row.end_time <= now]
+    current = {row.slot_id: row.id for row in due if row.end_time > now}
+    claimed = []
+    if current:
+        claimed = db.session.execute(
+            update(ParkingSlot)
+            .where(ParkingSlot.id.in_(current), ParkingSlot.is_available.is_(True))
+            .values(is_available=False)
+            .returning(ParkingSlot.id, ParkingSlot.zone_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if claimed:
+            record_slots_taken(zone_id for _, zone_id in claimed)
+            db.session.execute(
+                update(Booking)
+                .where(Booking.id.in_([current[slot_id] for slot_id, _ in claimed]))
+                .values(status='active')
+                .execution_options(synchronize_session=False)
+            )
+    if missed:
+        db.session.execute(
+            update(Booking).where(Booking.id.in_(missed)).values(status='cancelled')
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+    for slot_id, zone_id in claimed:
+        occupancy.mark_taken(zone_id, slot_id)
+    for booking_id in missed:
+        reservations.remove(booking_id)
+    if len(claimed) < len(current):
+        log.info("%s reservations are waiting for their slot to be released", len(current) - len(claimed))
+    return len(claimed)
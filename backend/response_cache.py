@@ -0,0 +1,96 @@
+"""Versioned cache for the lot listing responses.
+
+Every cached body is tagged with the listing version it was built at.
+The version is a single-row counter in the database (``listing_version``)
+that every change to what the listings show increments in the same
+transaction: slot claims and releases (through capacity.py), and lot
+creation, edits and deletion. Because it lives in the database, every
+web worker, the CLI and the Celery worker see the same version, and an
+entry is valid exactly while the counter is unchanged. The ETag is
+derived from the version and the cache key alone, so a matching
+``If-None-Match`` is answered with 304 after one primary-key read,
+before any listing query runs or any JSON is built.
+"""
+import hashlib
+import threading
+from sqlalchemy import select, update
+from models import db, ListingVersion
+
+CACHE_SIZE = 256
+
+
+def record_listing_change(conn=None):
+    """Stage a listing version increment in the caller's session (or ``conn``)."""
+    (conn or db.session).execute(
+        update(ListingVersion).values(version=ListingVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def create_and_seed(conn):
+    ListingVersion.__table__.create(conn, checkfirst=True)
+    if conn.execute(select(ListingVersion.id)).first() is None:
+        conn.execute(ListingVersion.__table__.insert().values(id=1, version=0))
+
+
+class ListingCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        # Last version read from the database; only reported in the metrics
+        self.version = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def current_version(self):
+        self.version = db.session.execute(select(ListingVersion.version)).scalar() or 0
+        return self.version
+
+    def etag(self, key, version):
+        return f'{version}-{hashlib.sha1(repr(key).encode()).hexdigest()[:12]}'
+
+    def get(self, key, version):
+        """``(etag, body, headers)`` for an entry built at ``version``, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, key, version, body, headers):
+        etag = self.etag(key, version)
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                self._entries.clear()
+            self._entries[key] = (version, etag, body, headers)
+        return etag
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def render_metrics(self):
+        with self._lock:
+            hits, misses, not_modified = self.hits, self.misses, self.not_modified
+        served = hits + misses + not_modified
+        ratio = (hits + not_modified) / served if served else 0.0
+        return (
+            '# HELP listing_cache_requests_total Lot listing requests by cache outcome.\n'
+            '# TYPE listing_cache_requests_total counter\n'
+            f'listing_cache_requests_total{{outcome="hit"}} {hits}\n'
+            f'listing_cache_requests_total{{outcome="miss"}} {misses}\n'
+            f'listing_cache_requests_total{{outcome="not_modified"}} {not_modified}\n'
+            '# HELP listing_cache_hit_ratio Share of lot listing requests served without rebuilding.\n'
+            '# TYPE listing_cache_hit_ratio gauge\n'
+            f'listing_cache_hit_ratio {ratio:.4f}\n'
+            '# HELP availability_version Listing version last read from the database.\n'
+            '# TYPE availability_version gauge\n'
+            f'availability_version {self.version}\n'
+        )
+
+
+listing_cache = ListingCache()
@@ -0,0 +1,98 @@
+"""Incrementally maintained counters behind the admin and user summaries.
+
+``record_*`` helpers stage their counter updates in the caller's session,
+so the rollup changes commit (or roll back) together with the booking,
+release or payment that caused them.
+"""
+from collections import defaultdict
+from sqlalchemy import select, update, delete, func
+from models import db, User, Booking, Payment, SummaryRollup
+from database import elapsed_hours
+
+GLOBAL = 0
+COUNTERS = ('users', 'bookings', 'payments', 'revenue', 'parked_hours')
+TABLE = SummaryRollup.__table__
+
+
+def _bump(user_ids, **deltas):
+    values = {name: getattr(SummaryRollup, name) + delta for name, delta in deltas.items()}
+    for user_id in user_ids:
+        result = db.session.execute(
+            update(SummaryRollup).where(SummaryRollup.user_id == user_id).values(**values)
+        )
+        if result.rowcount == 0:
+            row = {name: 0 for name in COUNTERS}
+            row.update(deltas)
+            db.session.execute(TABLE.insert().values(user_id=user_id, **row))
+
+
+def record_user_created():
+    _bump([GLOBAL], users=1)
+
+
+def record_booking(user_id, count=1):
+    _bump([GLOBAL, user_id], bookings=count)
+
+
+def record_release(user_id, hours):
+    _bump([GLOBAL, user_id], parked_hours=hours)
+
+
+def record_payment(user_id, amount):
+    _bump([GLOBAL, user_id], payments=1, revenue=amount)
+
+
+def record_user_deleted(user_id):
+    # Take the user's bookings and payments out of the global totals along with the user
+    row = db.session.get(SummaryRollup, user_id)
+    deltas = {'users': -1}
+    if row is not None:
+        deltas.update(bookings=-row.bookings, payments=-row.payments,
+                      revenue=-row.revenue, parked_hours=-row.parked_hours)
+    _bump([GLOBAL], **deltas)
+    db.session.execute(delete(SummaryRollup).where(SummaryRollup.user_id == user_id))
+
+
+def get_rollup(user_id=GLOBAL):
+    row = db.session.get(SummaryRollup, user_id)
+    if row is None:
+        return {name: 0 for name in COUNTERS}
+    return {name: getattr(row, name) for name in COUNTERS}
+
+
+def compute(conn):
+    """Recompute every counter from the base tables."""
+    totals = defaultdict(lambda: {name: 0 for name in COUNTERS})
+    totals[GLOBAL]['users'] = conn.execute(select(func.count(User.id))).scalar() or 0
+
+    for user_id, count in conn.execute(select(Booking.user_id, func.count(Booking.id)).group_by(Booking.user_id)):
+        totals[user_id]['bookings'] = count
+        totals[GLOBAL]['bookings'] += count
+
+    payments = select(Booking.user_id, func.count(Payment.id), func.sum(Payment.amount)) \
+        .join(Booking, Payment.booking_id == Booking.id).group_by(Booking.user_id)
+    for user_id, count, revenue in conn.execute(payments):
+        totals[user_id]['payments'] = count
+        totals[user_id]['revenue'] = revenue or 0.0
+        totals[GLOBAL]['payments'] += count
+        totals[GLOBAL]['revenue'] += revenue or 0.0
+
+    released = select(Booking.user_id, func.sum(elapsed_hours(Booking.start_time, Booking.end_time))) \
+        .where(Booking.status == 'completed').group_by(Booking.user_id)
+    for user_id, hours in conn.execute(released):
+        totals[user_id]['parked_hours'] = hours or 0.0
+        totals[GLOBAL]['parked_hours'] += hours or 0.0
+    return totals
+
+
+def rebuild(conn):
+    """Replace the rollup table with freshly computed counters; returns them."""
+    totals = compute(conn)
+    conn.execute(delete(SummaryRollup))
+    conn.execute(TABLE.insert(), [dict(user_id=user_id, **counters) for user_id, counters in totals.items()])
+    return totals
+
+
+def create_and_backfill(conn):
+    TABLE.create(conn, checkfirst=True)
+    rebuild(conn)
@@ -0,0 +1,160 @@
+"""Full-text search over users and parking lots.
+
+On SQLite the searchable columns are mirrored into FTS5 tables kept in
+sync by triggers (see ``create_fts_tables``), and results are ranked with
+bm25. Other backends fall back to ILIKE filters.
+"""
+import re
+from sqlalchemy import or_, text
+from models import db, User, ParkingZone, ParkingSlot
+
+FTS_SCHEMA = [
+    # Users: name, email, address, pincode
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "fullname, email, address, pincode, content='users', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, fullname, email, address, pincode) "
+    "VALUES (new.id, new.fullname, new.email, new.address, new.pincode); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, fullname, email, address, pincode) "
+    "VALUES ('delete', old.id, old.fullname, old.email, old.address, old.pincode); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF fullname, email, address, pincode ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, fullname, email, address, pincode) "
+    "VALUES ('delete', old.id, old.fullname, old.email, old.address, old.pincode); "
+    "INSERT INTO users_fts(rowid, fullname, email, address, pincode) "
+    "VALUES (new.id, new.fullname, new.email, new.address, new.pincode); END",
+
+    # Zones: name, city
+    "CREATE VIRTUAL TABLE IF NOT EXISTS zones_fts USING fts5("
+    "name, city, content='parking_zones', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS zones_fts_ai AFTER INSERT ON parking_zones BEGIN "
+    "INSERT INTO zones_fts(rowid, name, city) VALUES (new.id, new.name, new.city); END",
+    "CREATE TRIGGER IF NOT EXISTS zones_fts_ad AFTER DELETE ON parking_zones BEGIN "
+    "INSERT INTO zones_fts(zones_fts, rowid, name, city) VALUES ('delete', old.id, old.name, old.city); END",
+    "CREATE TRIGGER IF NOT EXISTS zones_fts_au AFTER UPDATE OF name, city ON parking_zones BEGIN "
+    "INSERT INTO zones_fts(zones_fts, rowid, name, city) VALUES ('delete', old.id, old.name, old.city); "
+    "INSERT INTO zones_fts(rowid, name, city) VALUES (new.id, new.name, new.city); END",
+
+    # Slots: location, pincode (availability flips do not touch the index)
+    "CREATE VIRTUAL TABLE IF NOT EXISTS slots_fts USING fts5("
+    "location, pincode, content='parking_slots', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS slots_fts_ai AFTER INSERT ON parking_slots BEGIN "
+    "INSERT INTO slots_fts(rowid, location, pincode) VALUES (new.id, new.location, new.pincode); END",
+    "CREATE TRIGGER IF NOT EXISTS slots_fts_ad AFTER DELETE ON parking_slots BEGIN "
+    "INSERT INTO slots_fts(slots_fts, rowid, location, pincode) "
+    "VALUES ('delete', old.id, old.location, old.pincode); END",
+    "CREATE TRIGGER IF NOT EXISTS slots_fts_au AFTER UPDATE OF location, pincode ON parking_slots BEGIN "
+    "INSERT INTO slots_fts(slots_fts, rowid, location, pincode) "
+    "VALUES ('delete', old.id, old.location, old.pincode); "
+    "INSERT INTO slots_fts(rowid, location, pincode) VALUES (new.id, new.location, new.pincode); END",
+
+    "INSERT INTO users_fts(users_fts) VALUES ('rebuild')",
+    "INSERT INTO zones_fts(zones_fts) VALUES ('rebuild')",
+    "INSERT INTO slots_fts(slots_fts) VALUES ('rebuild')",
+]
+
+# filter_type -> FTS columns searched for users, zones and slots
+USER_COLUMNS = {
+    'name': ['fullname'],
+    'email': ['email'],
+    'pincode': ['pincode'],
+    'address': ['address'],
+}
+ZONE_COLUMNS = {
+    'name': ['name'],
+    'email': [],
+    'pincode': [],
+    'address': [],
+}
+SLOT_COLUMNS = {
+    'name': [],
+    'email': [],
+    'pincode': ['pincode'],
+    'address': ['location'],
+}
+ALL_USER_COLUMNS = ['fullname', 'email', 'address', 'pincode']
+ALL_ZONE_COLUMNS = ['name', 'city']
+ALL_SLOT_COLUMNS = ['location', 'pincode']
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def create_fts_tables(conn):
+    if conn.dialect.name != 'sqlite':
+        return
+    for statement in FTS_SCHEMA:
+        conn.execute(text(statement))
+
+
+def uses_fts():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def match_expression(search_query, columns):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    tokens = TOKEN.findall(search_query)
+    if not tokens or not columns:
+        return None
+    terms = ' '.join(f'"{token}"*' for token in tokens)
+    return f'{{{" ".join(columns)}}} : ({terms})'
+
+
+def _ranked_ids(sql, match, limit):
+    rows = db.session.execute(text(sql), {'match': match, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+def _load_in_order(model, ids):
+    if not ids:
+        return []
+    by_id = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def search_users(search_query, filter_type, limit):
+    columns = USER_COLUMNS.get(filter_type, ALL_USER_COLUMNS)
+    if not uses_fts():
+        fields = [getattr(User, c) for c in columns]
+        if not fields:
+            return []
+        return User.query.filter(or_(*[f.ilike(f'%{search_query}%') for f in fields])).limit(limit).all()
+
+    match = match_expression(search_query, columns)
+    if match is None:
+        return []
+    ids = _ranked_ids(
+        'SELECT rowid FROM users_fts WHERE users_fts MATCH :match ORDER BY rank LIMIT :limit',
+        match, limit)
+    return _load_in_order(User, ids)
+
+
+def search_zones(search_query, filter_type, limit):
+    zone_columns = ZONE_COLUMNS.get(filter_type, ALL_ZONE_COLUMNS)
+    slot_columns = SLOT_COLUMNS.get(filter_type, ALL_SLOT_COLUMNS)
+    if not uses_fts():
+        fields = [getattr(ParkingZone, c) for c in zone_columns] + \
+            [getattr(ParkingSlot, c) for c in slot_columns]
+        if not fields:
+            return []
+        return ParkingZone.query.outerjoin(ParkingSlot).filter(
+            or_(*[f.ilike(f'%{search_query}%') for f in fields])
+        ).distinct().limit(limit).all()
+
+    zone_match = match_expression(search_query, zone_columns)
+    slot_match = match_expression(search_query, slot_columns)
+    parts = []
+    if zone_match:
+        parts.append('SELECT rowid AS zone_id, bm25(zones_fts) AS score FROM zones_fts '
+                     'WHERE zones_fts MATCH :zone_match')
+    if slot_match:
+        parts.append('SELECT s.zone_id AS zone_id, bm25(slots_fts) AS score FROM slots_fts '
+                     'JOIN parking_slots s ON s.id = slots_fts.rowid '
+                     'WHERE slots_fts MATCH :slot_match AND s.zone_id IS NOT NULL')
+    if not parts:
+        return []
+
+    # MATERIALIZED keeps bm25() inside the FTS scan instead of being flattened into the GROUP BY
+    sql = (f'WITH hits AS MATERIALIZED ({" UNION ALL ".join(parts)}) '
+           'SELECT zone_id FROM hits GROUP BY zone_id ORDER BY MIN(score) LIMIT :limit')
+    rows = db.session.execute(text(sql), {'zone_match': zone_match, 'slot_match': slot_match, 'limit': limit})
+    return _load_in_order(ParkingZone, [row[0] for row in rows])
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import update, select, exists, and_, bindparam
+from models import db, ParkingSlot, Booking
+from occupancy import occupancy
+from rollups import record_release
+from capacity import record_slots_freed
+from reservations import reservations, activate_due
+from pricing import price_slots, booking_hours
+from app_logging import get_logger
+
+DEFAULT_GRACE_MINUTES = 15
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INTERVAL_SECONDS = 60
+
+log = get_logger('sweeper')
+
+
+def _complete_batch(cutoff, batch_size):
+    """Complete up to ``batch_size`` overstayed bookings and free their slots.
+
+    Both steps are single set-based UPDATEs; RETURNING tells us exactly
+    which rows this pass changed, even if a user released one of them
+    concurrently.
+    """
+    expired = select(Booking.id).where(
+        Booking.status == 'active', Booking.end_time < cutoff
+    ).order_by(Booking.end_time).limit(batch_size)
+
+    completed = db.session.execute(
+        update(Booking)
+        .where(Booking.id.in_(expired.scalar_subquery()), Booking.status == 'active')
+        .values(status='completed')
+        .returning(Booking.id, Booking.slot_id, Booking.user_id, Booking.start_time, Booking.end_time)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not completed:
+        return [], []
+
+    # A slot may already hold a newer booking; only free slots nobody is parked in
+    slot_ids = {row.slot_id for row in completed}
+    still_taken = exists().where(and_(Booking.slot_id == ParkingSlot.id, Booking.status == 'active'))
+    freed = db.session.execute(
+        update(ParkingSlot)
+        .where(ParkingSlot.id.in_(slot_ids), ParkingSlot.is_available.is_(False), ~still_taken)
+        .values(is_available=True)
+        .returning(ParkingSlot.zone_id, ParkingSlot.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    record_slots_freed(zone_id for zone_id, _ in freed)
+
+    # Price the batch with one rate lookup and one executemany
+    costs = price_slots((row.id, row.slot_id, row.start_time, row.end_time) for row in completed)
+    db.session.execute(
+        update(Booking.__table__).where(Booking.__table__.c.id == bindparam('b_id')).values(cost=bindparam('b_cost')),
+        [{'b_id': booking_id, 'b_cost': cost} for booking_id, cost in costs.items()]
+    )
+
+    hours_by_user = defaultdict(float)
+    for row in completed:
+        hours_by_user[row.user_id] += booking_hours(row.start_time, row.end_time)
+    for user_id, hours in hours_by_user.items():
+        record_release(user_id, hours)
+    return completed, freed
+
+
+def sweep_expired(grace_minutes=DEFAULT_GRACE_MINUTES, batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Complete active bookings whose end_time passed more than ``grace_minutes`` ago.
+
+    Works in bounded batches, one transaction each, and returns how many
+    bookings were completed, how many slots were reclaimed and how long
+    the pass took.
+    """
+    started = time.perf_counter()
+    cutoff = (now or datetime.utcnow()) - timedelta(minutes=grace_minutes)
+    stats = {'bookings': 0, 'slots': 0, 'batches': 0}
+
+    while True:
+        completed, freed = _complete_batch(cutoff, batch_size)
+        db.session.commit()
+        if not completed:
+            break
+        for zone_id, slot_id in freed:
+            occupancy.mark_free(zone_id, slot_id)
+        for row in completed:
+            reservations.remove(row.id)
+        stats['batches'] += 1
+        stats['bookings'] += len(completed)
+        stats['slots'] += len(freed)
+        if len(completed) < batch_size:
+            break
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def start_sweeper(app):
+    """Run ``sweep_expired`` and ``activate_due`` every ``EXPIRY_SWEEP_SECONDS`` on a daemon thread.
+
+    The sweeper lives in the web process because it has to update that
+    process's occupancy index; it is started lazily so importing the app
+    (the Celery worker, the CLI) does not start it.
+    """
+    global _started
+    interval = app.config['EXPIRY_SWEEP_SECONDS']
+    if _started or interval <= 0:
+        return
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    stats = sweep_expired(app.config['EXPIRY_GRACE_MINUTES'], app.config['EXPIRY_BATCH_SIZE'])
+                    if stats['bookings']:
+                        log.info("Expiry sweep reclaimed %s slots from %s bookings in %ss",
+                                 stats['slots'], stats['bookings'], stats['seconds'])
+                    # Freed slots may be exactly what a starting reservation is waiting for
+                    activated = activate_due()
+                    if activated:
+                        log.info("Started %s reservations", activated)
+                except Exception:
+                    db.session.rollback()
+                    log.exception("Expiry sweep failed")
+                finally:
+                    db.session.remove()
+            time.sleep(interval)
+
+    threading.Thread(target=run, name='expiry-sweeper', daemon=True).start()
@@ -0,0 +1,126 @@
+"""Background jobs run by the Celery worker (``celery -A celery_worker.celery worker``).
+
+By default the broker and result backend are SQLite files in the Flask
+instance folder, so jobs work offline without Redis or RabbitMQ. Set
+``CELERY_TASK_ALWAYS_EAGER=1`` to run jobs inline with no worker at all.
+
+Every task takes and returns an ``owner`` ("user:<id>" or
+"admin:<id>"). Jobs are started through ``enqueue_job`` in app.py, whose
+job ids carry a signature of that owner, so the polling endpoint hands a
+job back, in whatever state, only to the principal that started it.
+
+CSV exports are written to ``EXPORT_DIR``; each new export first deletes
+files older than ``result_expires``, whose job results are gone too.
+"""
+import base64
+import os
+import time
+from datetime import datetime, timedelta
+from celery import Celery
+from flask import current_app
+from models import db, Payment
+from exports import user_bookings_csv, admin_bookings_csv, render_bill
+from qr_codes import render_qr
+from rollups import rebuild
+
+celery = Celery('parking')
+
+
+def init_celery(app):
+    instance = app.instance_path
+    os.makedirs(instance, exist_ok=True)
+    app.config.setdefault('CELERY_BROKER_URL', os.environ.get(
+        'CELERY_BROKER_URL', f"sqla+sqlite:///{os.path.join(instance, 'celery-broker.db')}"))
+    app.config.setdefault('CELERY_RESULT_BACKEND', os.environ.get(
+        'CELERY_RESULT_BACKEND', f"db+sqlite:///{os.path.join(instance, 'celery-results.db')}"))
+    app.config.setdefault('CELERY_TASK_ALWAYS_EAGER', os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1')
+    app.config.setdefault('EXPORT_DIR', os.path.join(instance, 'exports'))
+
+    celery.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND'],
+        task_always_eager=app.config['CELERY_TASK_ALWAYS_EAGER'],
+        # Eager results are stored too, so polling behaves the same with or without a worker
+        task_store_eager_result=True,
+        task_track_started=True,
+        result_expires=24 * 3600,
+    )
+
+    class ContextTask(celery.Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery.Task = ContextTask
+    return celery
+
+
+def _prune_exports(export_dir):
+    # A file outlives its job's result row by at most the interval between two exports
+    max_age = celery.conf.result_expires
+    if isinstance(max_age, timedelta):
+        max_age = max_age.total_seconds()
+    if not max_age:
+        return
+    cutoff = time.time() - max_age
+    with os.scandir(export_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.name.endswith('.csv') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+
+
+def _export_path(job_id):
+    export_dir = current_app.config['EXPORT_DIR']
+    os.makedirs(export_dir, exist_ok=True)
+    _prune_exports(export_dir)
+    return os.path.join(export_dir, f'{job_id}.csv')
+
+
+def _write_chunks(path, chunks):
+    rows = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            rows += chunk.count('\n')
+    return max(rows - 1, 0)  # minus the header
+
+
+@celery.task(bind=True, name='parking.export_user_csv')
+def export_user_csv(self, owner, user_id):
+    path = _export_path(self.request.id)
+    rows = _write_chunks(path, user_bookings_csv(user_id))
+    return {'owner': owner, 'file': os.path.basename(path), 'rows': rows}
+
+
+@celery.task(bind=True, name='parking.export_admin_csv')
+def export_admin_csv(self, owner, start=None, end=None):
+    start = datetime.fromisoformat(start) if start else None
+    end = datetime.fromisoformat(end) if end else None
+    path = _export_path(self.request.id)
+    rows = _write_chunks(path, admin_bookings_csv(start, end))
+    return {'owner': owner, 'file': os.path.basename(path), 'rows': rows}
+
+
+@celery.task(name='parking.render_bill')
+def render_bill_job(owner, payment_id):
+    payment = db.session.get(Payment, payment_id)
+    if payment is None:
+        return {'owner': owner, 'error': 'Payment not found'}
+    return {'owner': owner, 'bill_content': render_bill(payment)}
+
+
+@celery.task(name='parking.render_qr')
+def render_qr_job(owner, upi_string):
+    qr_base64 = base64.b64encode(render_qr(upi_string)).decode()
+    return {'owner': owner, 'qr_code': f'data:image/png;base64,{qr_base64}', 'upi_string': upi_string}
+
+
+@celery.task(name='parking.rebuild_summaries')
+def rebuild_summaries_job(owner):
+    db.session.remove()
+    with db.engine.begin() as conn:
+        totals = rebuild(conn)
+    return {'owner': owner, 'rows': len(totals)}